@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -46,7 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.routing.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,13 +84,55 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are kept for DB_CONN_MAX_AGE seconds and checked before reuse.
+# DB_PGBOUNCER=1 turns off server-side cursors, which transaction pooling breaks;
+# iterator() based exports then buffer each result set on the client.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER', '0') == '1',
+    }
+}
+
+# Optional read replicas, e.g. DB_REPLICA_HOSTS=replica1,replica2
+# Replicas share the primary's name and credentials unless DB_REPLICA_* is set
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASS', DATABASES['default']['PASSWORD']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routing.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE = os.environ.get('REPLICA_PIN_CACHE', 'default')
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared backend in production, e.g.
+# django.core.cache.backends.memcached.PyMemcacheCache and memcached:11211.
+# serve refuses to start several workers on the process local default.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -137,4 +184,101 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
\ No newline at end of file
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.ScopedSlidingWindowThrottle'],
+    # Requests per user, or per IP when anonymous, empty disables a scope
+    'DEFAULT_THROTTLE_RATES': {
+        scope: os.environ.get(f'THROTTLE_RATE_{scope.upper()}', rate) or None
+        for scope, rate in [
+            ('read', '1200/min'),
+            ('write', '240/min'),
+            ('bulk', '20/min'),
+            ('auth', '20/min'),
+        ]
+    },
+}
+
+# Recipe list pagination
+# Page size is overridable per request with ?page_size= up to the max
+RECIPE_PAGE_SIZE = int(os.environ.get('RECIPE_PAGE_SIZE', 50))
+RECIPE_MAX_PAGE_SIZE = int(os.environ.get('RECIPE_MAX_PAGE_SIZE', 500))
+# Serialize list pages straight from .values() rows instead of RecipeSerializers
+RECIPE_FAST_LIST = os.environ.get('RECIPE_FAST_LIST', '1') == '1'
+
+# Bulk recipe import
+# Valid lines are inserted every RECIPE_IMPORT_CHUNK_SIZE recipes
+RECIPE_IMPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_IMPORT_CHUNK_SIZE', 500))
+RECIPE_IMPORT_MAX_ERRORS = int(os.environ.get('RECIPE_IMPORT_MAX_ERRORS', 100))
+
+# Recipe export
+# Rows fetched per server-side cursor round trip
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 2000))
+
+# Token authentication cache
+# Cache alias and lifetime of cached token -> user lookups
+TOKEN_AUTH_CACHE = os.environ.get('TOKEN_AUTH_CACHE', 'default')
+TOKEN_AUTH_CACHE_TIMEOUT = int(os.environ.get('TOKEN_AUTH_CACHE_TIMEOUT', 300))
+
+# Recipe and tag list response cache
+# Entries are keyed on a per-user catalog version, so the timeout only bounds memory
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'default')
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 600))
+
+# Recipe search
+# Typo tolerant title matching, used only where the pg_trgm extension is installed
+RECIPE_SEARCH_TRIGRAM = os.environ.get('RECIPE_SEARCH_TRIGRAM', '1') == '1'
+
+# Denormalized recipe tags
+# Filter and list recipes by the tag_ids/tag_names arrays instead of joining tags
+RECIPE_TAG_ARRAYS = os.environ.get('RECIPE_TAG_ARRAYS', '1') == '1'
+
+# Recipe statistics
+# Upper bounds of the price buckets; rerun rebuild_recipe_stats after changing them
+RECIPE_STATS_PRICE_BUCKETS = os.environ.get('RECIPE_STATS_PRICE_BUCKETS', '5,10,20,50,100').split(',')
+
+# Request instrumentation
+# Fraction of requests measured for Server-Timing and the /metrics endpoint
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', 0.1))
+INSTRUMENTATION_SERVER_TIMING = os.environ.get('INSTRUMENTATION_SERVER_TIMING', '1') == '1'
+# Workers publish their series to this cache, use a shared one with several workers
+INSTRUMENTATION_CACHE = os.environ.get('INSTRUMENTATION_CACHE', 'default')
+INSTRUMENTATION_FLUSH_SECONDS = int(os.environ.get('INSTRUMENTATION_FLUSH_SECONDS', 10))
+# Silence after which a worker's counts are folded into the retired total
+INSTRUMENTATION_SNAPSHOT_TIMEOUT = int(os.environ.get('INSTRUMENTATION_SNAPSHOT_TIMEOUT', 3600))
+# Bearer token required to scrape /metrics, which refuses every request when empty
+INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN', '')
+
+# Password hashing
+# PASSWORD_HASHER=argon2 (needs argon2-cffi) or bcrypt (needs bcrypt) becomes the
+# preferred hasher; older hashes keep working and are upgraded on the next login
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+_PREFERRED_HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+}
+if PASSWORD_HASHER not in _PREFERRED_HASHERS:
+    raise ImproperlyConfigured(f'PASSWORD_HASHER must be one of: {", ".join(_PREFERRED_HASHERS)}')
+PASSWORD_HASHERS = [_PREFERRED_HASHERS[PASSWORD_HASHER]] + [
+    hasher for hasher in [
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    ]
+    if hasher != _PREFERRED_HASHERS[PASSWORD_HASHER]
+]
+
+# Login rate limiting
+# Failed logins allowed per email and per client IP in each window, 0 disables
+LOGIN_RATE_LIMIT_CACHE = os.environ.get('LOGIN_RATE_LIMIT_CACHE', 'default')
+LOGIN_RATE_LIMIT_WINDOW = int(os.environ.get('LOGIN_RATE_LIMIT_WINDOW', 300))
+LOGIN_RATE_LIMIT_PER_EMAIL = int(os.environ.get('LOGIN_RATE_LIMIT_PER_EMAIL', 10))
+LOGIN_RATE_LIMIT_PER_IP = int(os.environ.get('LOGIN_RATE_LIMIT_PER_IP', 100))
+
+# API throttling
+# Cache holding the throttle counters, shared between processes in production
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE', 'default')
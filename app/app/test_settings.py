@@ -0,0 +1,41 @@
+"""
+    Settings for running the test suite, used by manage.py test.
+
+    Password hashing is cheap, commits skip the WAL flush and the test
+    database is kept between runs. Production hashing in settings.py is
+    unchanged.
+"""
+
+from app.settings import *  # noqa: F401,F403
+
+# Tests create users constantly and full strength PBKDF2 dominates their runtime
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Committed test data need not survive a crash of the database server
+DATABASES['default']['OPTIONS'] = {
+    **DATABASES['default'].get('OPTIONS', {}),
+    'options': '-c synchronous_commit=off',
+}
+
+# Stand-in replicas on the test database, replica tests turn routing on with DATABASE_REPLICAS
+for alias in ('replica_0', 'replica_1'):
+    DATABASES[alias] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = []
+
+# Process local caches, so --parallel workers never see each other's entries
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+# Keeps the test database unless --no-keepdb, --parallel clones it per process
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Throttle counters stay in process memory, throttling tests set the rates they exercise
+THROTTLE_CACHE = 'default'
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {scope: None for scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+}
@@ -18,10 +18,13 @@ from django.urls import path, include
 # Enabling api schema and swagger ui plugin for that schema
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from core.instrumentation import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name = 'api-schema'), name='api-docs'),
     path('api/user/', include('user.urls')),
-    path('api/recipe/', include('recipe.urls'))
+    path('api/recipe/', include('recipe.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registering signal handlers and system checks
+        from core import checks, signals  # noqa: F401
+
+        from django.db.models import CharField
+        from core.search import TrigramWordSimilar
+        CharField.register_lookup(TrigramWordSimilar)
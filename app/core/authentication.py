@@ -0,0 +1,70 @@
+"""
+    Authentication classes shared by the API apps
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import authentication
+from rest_framework.authtoken.models import Token
+
+
+def token_cache():
+    """Return the cache holding authenticated tokens"""
+
+    return caches[settings.TOKEN_AUTH_CACHE]
+
+
+def token_cache_key(key):
+    """Cache key for a token, hashed so key listings do not reveal tokens.
+
+    The cached value is the Token with its user, key and password hash
+    included, so TOKEN_AUTH_CACHE must only be reachable by the app.
+    """
+
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_tokens(keys):
+    """Drop cached entries for the given token keys"""
+
+    token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+def issue_token(user):
+    """Return the user's token key, creating the token on first login.
+
+    get_or_create only reads the token row once it exists, so repeated
+    logins cost one indexed lookup and never rewrite it.
+    """
+
+    return Token.objects.get_or_create(user = user)[0].key
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """Token authentication caching the token -> user lookup.
+
+    Entries live for TOKEN_AUTH_CACHE_TIMEOUT seconds and are dropped by
+    the signal handlers in ``core.signals`` when a token is deleted or its
+    user is saved. With a per-process cache such as LocMemCache the
+    invalidation only reaches the current process, so multi-process
+    deployments should point TOKEN_AUTH_CACHE at a shared backend, one
+    private to the app as the entries hold tokens and password hashes.
+    """
+
+    def cached_credentials(self, key):
+        """Return the cached (user, token) pair for the key, or None"""
+
+        token = token_cache().get(token_cache_key(key))
+        if token is None:
+            return None
+        return (token.user, token)
+
+    def authenticate_credentials(self, key):
+        credentials = self.cached_credentials(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            token_cache().set(token_cache_key(key), credentials[1],
+                              settings.TOKEN_AUTH_CACHE_TIMEOUT)
+        return credentials
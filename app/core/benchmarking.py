@@ -0,0 +1,106 @@
+"""
+    Helpers shared by the benchmark management commands
+"""
+
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag
+
+WORDS = [
+    'chicken', 'paneer', 'tofu', 'lentil', 'rice', 'noodle', 'curry', 'soup',
+    'salad', 'biryani', 'masala', 'tikka', 'garlic', 'ginger', 'lemon', 'mango',
+    'coconut', 'spinach', 'potato', 'tomato', 'chilli', 'roasted', 'grilled',
+    'baked', 'fried', 'steamed', 'spicy', 'creamy', 'crispy', 'smoky', 'sweet',
+    'pancake', 'dosa', 'idli', 'pasta', 'burger', 'sandwich', 'pudding', 'cake',
+    'cookie', 'bread', 'omelette', 'kebab', 'stew', 'risotto', 'taco', 'wrap',
+]
+
+
+def random_text(rng, words):
+    """Deterministic pseudo sentence drawn from the shared vocabulary"""
+
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed_catalog(user, rng, recipes, tags, tags_per_recipe, batch_size = 5000):
+    """Bulk insert a synthetic catalog for one user, batch by batch.
+
+    Search vectors and tag arrays are filled in at the end. Returns the
+    created tags. Memory use is bounded by ``batch_size``.
+    """
+
+    tag_objs = Tag.objects.bulk_create(
+        [Tag(user = user, name = f'tag-{i}') for i in range(tags)]
+    )
+    Through = Recipe.tags.through
+
+    for start in range(0, recipes, batch_size):
+        batch = Recipe.objects.bulk_create([
+            Recipe(user = user, title = random_text(rng, 3),
+                   description = random_text(rng, 12),
+                   time_minutes = rng.randint(1, 240),
+                   price = rng.randint(100, 99999) / 100)
+            for _ in range(min(batch_size, recipes - start))
+        ])
+        Through.objects.bulk_create([
+            Through(recipe_id = recipe.id, tag_id = tag.id)
+            for recipe in batch
+            for tag in rng.sample(tag_objs, min(tags_per_recipe, len(tag_objs)))
+        ])
+
+    Recipe.objects.filter(user = user).refresh_derived_fields()
+    analyze()
+    return tag_objs
+
+
+@contextmanager
+def rolled_back_catalog(rng, recipes, tags, tags_per_recipe):
+    """Seed a benchmark user's catalog in a transaction rolled back on exit.
+
+    Yields the user and their tags. The rollback removes the rows but not
+    the cost of writing them: the transaction holds its locks until the
+    end and leaves dead tuples and index bloat that change later query
+    plans. Only run the benchmarks on a throwaway database, never on a
+    shared or production one.
+    """
+
+    with transaction.atomic():
+        user = get_user_model().objects.create_user('benchmark@example.com')
+        tag_objs = seed_catalog(user, rng, recipes, tags, tags_per_recipe)
+        try:
+            yield user, tag_objs
+        finally:
+            transaction.set_rollback(True)
+
+
+def analyze():
+    """Refresh planner statistics, fresh rows have none until analyzed"""
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_recipe, core_tag, core_recipe_tags')
+
+
+def time_queryset(queryset, repeat):
+    """Evaluate the queryset repeatedly and return (rows, timings in ms)"""
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len(list(queryset.all()))
+        timings.append((time.perf_counter() - start) * 1000)
+    return rows, timings
+
+
+def format_timings(label, rows, timings):
+    """One report line with the median and p95 of the timings"""
+
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f'{label:<32} rows={rows:<5} '
+            f'median={statistics.median(ordered):.2f}ms p95={p95:.2f}ms')
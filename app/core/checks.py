@@ -0,0 +1,54 @@
+"""
+    System checks for optional dependencies and deployment settings
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.checks import Error, Tags, register
+
+# Caches holding state every worker process must see
+SHARED_CACHE_SETTINGS = [
+    'RESPONSE_CACHE', 'TOKEN_AUTH_CACHE', 'THROTTLE_CACHE', 'LOGIN_RATE_LIMIT_CACHE',
+    'REPLICA_PIN_CACHE', 'INSTRUMENTATION_CACHE',
+]
+
+
+@register(Tags.security)
+def check_password_hasher(app_configs, **kwargs):
+    """The preferred password hasher's library must be installed"""
+
+    hasher = get_hasher()
+    if getattr(hasher, 'library', None):
+        try:
+            hasher._load_library()
+        except ValueError as exc:
+            return [Error(
+                str(exc),
+                hint = 'Install argon2-cffi or bcrypt, or unset PASSWORD_HASHER.',
+                id = 'core.E001',
+            )]
+    return []
+
+
+@register(Tags.caches, deploy = True)
+def check_shared_caches(app_configs, **kwargs):
+    """Cross-request caches must not be process local under several workers.
+
+    Runs with check --deploy and when serve starts more than one worker.
+    With a LocMemCache, a write bumps the catalog version in one worker
+    while the others keep serving stale pages, and throttle counters and
+    token invalidations stay per worker.
+    """
+
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name, None)
+        backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+        if backend == 'django.core.cache.backends.locmem.LocMemCache':
+            errors.append(Error(
+                f'{name} points at the process local cache {alias!r}.',
+                hint = 'Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as memcached, '
+                       'or serve with --workers 1.',
+                id = 'core.E002',
+            ))
+    return errors
@@ -0,0 +1,45 @@
+"""
+    PostgreSQL backend checking persistent connections before reuse
+"""
+
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Postgres wrapper with CONN_HEALTH_CHECKS support.
+
+    With CONN_MAX_AGE a connection outlives the request that opened it.
+    When CONN_HEALTH_CHECKS is set, the first use of a reused connection in
+    each request runs ``SELECT 1`` and reconnects if the server, a pooler or
+    the network dropped it in the meantime, instead of failing the request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return bool(self.settings_dict.get('CONN_HEALTH_CHECKS'))
+
+    def connect(self):
+        # A new connection needs no check, also while it is being set up
+        self.health_check_done = True
+        super().connect()
+
+    @async_unsafe
+    def ensure_connection(self):
+        if (self.connection is not None
+                and self.health_check_enabled
+                and not self.health_check_done
+                and not self.in_atomic_block):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Called at request start and end, so each request checks once
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
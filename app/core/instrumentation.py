@@ -0,0 +1,401 @@
+"""
+    Sampled per-request query, timing and size instrumentation with a
+    Prometheus metrics endpoint
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = contextvars.ContextVar('request_metrics', default = None)
+
+
+class RequestMetrics:
+    """What one sampled request spent, durations in seconds"""
+
+    __slots__ = ('queries', 'db', 'serialize', 'render')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper counting queries of sampled requests"""
+
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db += time.perf_counter() - start
+
+
+def install(connection):
+    """Add record_query to a database connection once"""
+
+    if record_query not in connection.execute_wrappers:
+        # First, so connection.execute_wrapper() blocks popping theirs leave it alone
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def measuring():
+    """Collect the queries and phase timings of the enclosed code"""
+
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(phase):
+    """Add the block's duration, minus its queries, to the sampled request's phase"""
+
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    start, db = time.perf_counter(), metrics.db
+    try:
+        yield
+    finally:
+        spent = time.perf_counter() - start - (metrics.db - db)
+        setattr(metrics, phase, getattr(metrics, phase) + spent)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Time ``.data`` as serializer time; pair with TimedListSerializer in Meta"""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+def _new_series():
+    return {
+        'count': 0,
+        'duration_sum': 0.0,
+        'duration_buckets': [0] * (len(DURATION_BUCKETS) + 1),
+        'queries_sum': 0,
+        'query_buckets': [0] * (len(QUERY_BUCKETS) + 1),
+        'db_sum': 0.0,
+        'serialize_sum': 0.0,
+        'render_sum': 0.0,
+        'bytes_sum': 0,
+    }
+
+
+def _bucket(bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+def _copy(snapshot):
+    return {key: {name: list(value) if isinstance(value, list) else value
+                  for name, value in series.items()}
+            for key, series in snapshot.items()}
+
+
+def _merge(total, snapshot, sign = 1):
+    """Add (or with sign -1, subtract) a snapshot into total in place"""
+
+    for key, series in snapshot.items():
+        merged = total.setdefault(key, _new_series())
+        for name, value in series.items():
+            if isinstance(value, list):
+                merged[name] = [a + sign * b for a, b in zip(merged[name], value)]
+            else:
+                merged[name] += sign * value
+    return total
+
+
+class Registry:
+    """Cumulative per-route series of this process.
+
+    Every INSTRUMENTATION_FLUSH_SECONDS a snapshot is written to the
+    INSTRUMENTATION_CACHE under a slot numbered with incr(), alongside a
+    heartbeat expiring after INSTRUMENTATION_SNAPSHOT_TIMEOUT. The metrics
+    endpoint sums the snapshots of all slots. Slots whose heartbeat expired,
+    such as workers recycled by --max-requests, are folded into a retired
+    total under a lock, so the summed counters never go down.
+    """
+
+    COUNT_KEY = 'instrumentation:slots'
+    RETIRED_KEY = 'instrumentation:retired'
+    LOCK_KEY = 'instrumentation:fold-lock'
+
+    def __init__(self):
+        self.series = {}
+        self._lock = threading.Lock()
+        # Held from the interval check to the snapshot write, so concurrent
+        # threads never claim two slots or publish from the same base
+        self._flush_lock = threading.Lock()
+        self._flushed = time.monotonic()
+        self._pid = None
+        self.slot = None
+        # What earlier slots of this process already published
+        self._published = {}
+        self._base = {}
+
+    @staticmethod
+    def _snapshot_key(slot):
+        return f'instrumentation:slot:{slot}'
+
+    @staticmethod
+    def _alive_key(slot):
+        return f'instrumentation:alive:{slot}'
+
+    def observe(self, route, method, duration, metrics, size):
+        with self._lock:
+            series = self.series.setdefault((route, method), _new_series())
+            series['count'] += 1
+            series['duration_sum'] += duration
+            series['duration_buckets'][_bucket(DURATION_BUCKETS, duration)] += 1
+            series['queries_sum'] += metrics.queries
+            series['query_buckets'][_bucket(QUERY_BUCKETS, metrics.queries)] += 1
+            series['db_sum'] += metrics.db
+            series['serialize_sum'] += metrics.serialize
+            series['render_sum'] += metrics.render
+            series['bytes_sum'] += size
+
+    def due(self):
+        """Whether the next flush() would publish"""
+
+        return time.monotonic() - self._flushed >= settings.INSTRUMENTATION_FLUSH_SECONDS
+
+    def flush(self, force = False):
+        with self._flush_lock:
+            if not force and not self.due():
+                return
+            now = time.monotonic()
+            idle = now - self._flushed
+            self._flushed = now
+
+            cache = caches[settings.INSTRUMENTATION_CACHE]
+            timeout = settings.INSTRUMENTATION_SNAPSHOT_TIMEOUT
+            # A new slot after the gunicorn fork, and when the heartbeat may have
+            # expired and the old slot been folded; it only carries what is new
+            if self.slot is None or self._pid != os.getpid() or idle >= timeout / 2:
+                self._pid = os.getpid()
+                self._base = _copy(self._published)
+                cache.add(self.COUNT_KEY, 0, None)
+                self.slot = cache.incr(self.COUNT_KEY)
+
+            with self._lock:
+                current = _copy(self.series)
+            self._published = current
+            cache.set(self._snapshot_key(self.slot), _merge(_copy(current), self._base, -1), None)
+            cache.set(self._alive_key(self.slot), True, timeout)
+
+    def collect(self):
+        """Sum the retired total and the snapshots of every slot still unfolded"""
+
+        cache = caches[settings.INSTRUMENTATION_CACHE]
+        retired = cache.get(self.RETIRED_KEY) or {'series': {}, 'first': 1, 'folded': set()}
+        slots = [slot for slot in range(retired['first'], (cache.get(self.COUNT_KEY) or 0) + 1)
+                 if slot not in retired['folded']]
+        values = cache.get_many([self._snapshot_key(slot) for slot in slots]
+                                + [self._alive_key(slot) for slot in slots])
+
+        total = _copy(retired['series'])
+        dead = []
+        for slot in slots:
+            snapshot = values.get(self._snapshot_key(slot))
+            if snapshot is None:
+                continue
+            _merge(total, snapshot)
+            if self._alive_key(slot) not in values:
+                dead.append(slot)
+
+        if dead:
+            self._fold(cache, dead)
+        return total
+
+    def _fold(self, cache, slots):
+        """Move expired slots into the retired total.
+
+        The total and the set of folded slots are one cache value, so a
+        concurrent collect counts each slot exactly once.
+        """
+
+        if not cache.add(self.LOCK_KEY, True, 30):
+            return
+        try:
+            retired = cache.get(self.RETIRED_KEY) or {'series': {}, 'first': 1, 'folded': set()}
+            snapshots = cache.get_many([self._snapshot_key(slot) for slot in slots])
+            for slot in slots:
+                if slot in retired['folded'] or self._snapshot_key(slot) not in snapshots:
+                    continue
+                _merge(retired['series'], snapshots[self._snapshot_key(slot)])
+                retired['folded'].add(slot)
+            cache.set(self.RETIRED_KEY, retired, None)
+            cache.delete_many([self._snapshot_key(slot) for slot in slots])
+
+            # Folded slots at the start of the range need no further lookups
+            while retired['first'] in retired['folded']:
+                retired['folded'].discard(retired['first'])
+                retired['first'] += 1
+            cache.set(self.RETIRED_KEY, retired, None)
+        finally:
+            cache.delete(self.LOCK_KEY)
+
+
+registry = Registry()
+
+
+def _labels(route, method, **extra):
+    pairs = {'route': route, 'method': method, **extra}
+    return ','.join(f'{name}="{value}"' for name, value in pairs.items())
+
+
+def _histogram(lines, name, key, bounds, buckets, total, count):
+    labels = _labels(*key)
+    running = 0
+    for bound, observed in zip(list(bounds) + ['+Inf'], buckets):
+        running += observed
+        lines.append(f'{name}_bucket{{{_labels(*key, le = bound)}}} {running}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {count}')
+
+
+def render_prometheus(series):
+    """Prometheus text exposition of the collected series"""
+
+    lines = [
+        '# HELP app_instrumentation_sample_rate Fraction of requests instrumented',
+        '# TYPE app_instrumentation_sample_rate gauge',
+        f'app_instrumentation_sample_rate {settings.INSTRUMENTATION_SAMPLE_RATE}',
+        '# HELP app_request_duration_seconds Latency of sampled requests',
+        '# TYPE app_request_duration_seconds histogram',
+    ]
+    for key, values in sorted(series.items()):
+        _histogram(lines, 'app_request_duration_seconds', key, DURATION_BUCKETS,
+                   values['duration_buckets'], values['duration_sum'], values['count'])
+
+    lines += ['# HELP app_request_queries SQL queries per sampled request',
+              '# TYPE app_request_queries histogram']
+    for key, values in sorted(series.items()):
+        _histogram(lines, 'app_request_queries', key, QUERY_BUCKETS,
+                   values['query_buckets'], values['queries_sum'], values['count'])
+
+    counters = [
+        ('app_request_db_seconds_total', 'db_sum', 'Time spent in SQL by sampled requests'),
+        ('app_request_serializer_seconds_total', 'serialize_sum', 'Time spent in serializers'),
+        ('app_request_render_seconds_total', 'render_sum', 'Time spent rendering responses'),
+        ('app_response_bytes_total', 'bytes_sum', 'Body size of sampled non-streaming responses'),
+    ]
+    for name, field, description in counters:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        for key, values in sorted(series.items()):
+            lines.append(f'{name}{{{_labels(*key)}}} {values[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, guarded by INSTRUMENTATION_METRICS_TOKEN"""
+
+    # Per-route latencies and query counts are not public, no token means no access
+    token = settings.INSTRUMENTATION_METRICS_TOKEN
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status = 403)
+
+    registry.flush(force = True)
+    return HttpResponse(render_prometheus(registry.collect()),
+                        content_type = 'text/plain; version=0.0.4; charset=utf-8')
+
+
+class InstrumentationMiddleware:
+    """Measure a sample of requests: queries, DB, serializer and render time, size.
+
+    Sampled responses carry a Server-Timing header and feed the per-route
+    series served by the metrics view. Unsampled requests only pay for a
+    random number. Works under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marking the instance as a coroutine function for the async handler
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with measuring() as metrics:
+            response = self.get_response(request)
+        self._finish(request, response, metrics, time.perf_counter() - start)
+        registry.flush()
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        with measuring() as metrics:
+            response = await self.get_response(request)
+        self._finish(request, response, metrics, time.perf_counter() - start)
+        # Publishing is blocking cache I/O, kept off the event loop
+        if registry.due():
+            await sync_to_async(registry.flush, thread_sensitive = False)()
+        return response
+
+    def _sampled(self):
+        rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def _finish(self, request, response, metrics, duration):
+        # Streamed bodies are produced after this point and are not measured
+        size = 0 if response.streaming else len(response.content)
+        match = request.resolver_match
+        route = match.view_name if match is not None else 'unmatched'
+
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db * 1000:.1f};desc="{metrics.queries} queries"',
+                f'serialize;dur={metrics.serialize * 1000:.1f}',
+                f'render;dur={metrics.render * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f};desc="{size} bytes"',
+            ])
+        registry.observe(route, request.method, duration, metrics, size)
@@ -0,0 +1,62 @@
+"""
+    Django management command comparing the recipe list serializer paths
+"""
+
+import random
+import time
+
+from django.core.management import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmarking import format_timings, rolled_back_catalog
+from core.models import Recipe, Tag
+from core.renderers import FastJSONRenderer
+from recipe.serializers import RecipeRowSerializer, RecipeSerializers
+
+
+def _model_path(queryset):
+    recipes = queryset.prefetch_related(Prefetch('tags', Tag.objects.order_by('name')))
+    return JSONRenderer().render(RecipeSerializers(recipes, many = True).data)
+
+
+def _row_path(queryset):
+    rows = list(queryset.values(*RecipeRowSerializer.values_fields()))
+    return FastJSONRenderer().render(RecipeRowSerializer(rows).data)
+
+
+class Command(BaseCommand):
+    """Time query, serialization and rendering of list pages of each size.
+
+    The rows come from rolled_back_catalog(), see there why this belongs on
+    a disposable database.
+    """
+
+    help = 'Compare RecipeSerializers + JSONRenderer with the .values() row path (disposable databases only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with rolled_back_catalog(rng, max(options['rows']), options['tags'],
+                                 options['tags_per_recipe']) as (user, _):
+            base = Recipe.objects.filter(user = user).order_by('-id')
+
+            for rows in options['rows']:
+                page = base[:rows]
+                if _model_path(page) != _row_path(page):
+                    self.stderr.write(f'Output differs at {rows} rows')
+
+                for label, render in (('serializer', _model_path), ('values rows', _row_path)):
+                    timings = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        render(page)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    self.stdout.write(format_timings(f'{label}: {rows}', rows, timings))
@@ -0,0 +1,62 @@
+"""
+    Django management command comparing the recipe tag filter query forms
+"""
+
+import random
+
+from django.core.management import BaseCommand
+
+from core.benchmarking import format_timings, rolled_back_catalog, time_queryset
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Benchmark JOIN + DISTINCT against EXISTS / HAVING and the tag_ids array.
+
+    Seeds a throwaway catalog with rolled_back_catalog(); the writes still
+    bloat tables and indexes, so run it on a disposable database only.
+    """
+
+    help = 'Compare the recipe tag filter query forms on seeded data (disposable databases only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--tags-per-recipe', type=int, default=5)
+        parser.add_argument('--filter-tags', type=int, default=3)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        self.stdout.write(
+            f"Seeding {options['recipes']} recipes and {options['tags']} tags...")
+        with rolled_back_catalog(rng, options['recipes'], options['tags'],
+                                 options['tags_per_recipe']) as (user, tags):
+            tag_ids = [tag.id for tag in rng.sample(tags, options['filter_tags'])]
+            base = Recipe.objects.filter(user = user)
+            page = slice(0, options['page_size'])
+
+            join_all = base
+            for tag_id in tag_ids:
+                join_all = join_all.filter(tags__id = tag_id)
+
+            cases = [
+                ('any: join + distinct',
+                 base.filter(tags__id__in = tag_ids).order_by('-id').distinct()),
+                ('any: exists',
+                 base.with_tags(tag_ids, use_arrays = False).order_by('-id')),
+                ('any: tag_ids &&',
+                 base.with_tags(tag_ids, use_arrays = True).order_by('-id')),
+                ('all: chained joins + distinct',
+                 join_all.order_by('-id').distinct()),
+                ('all: group by / having',
+                 base.with_tags(tag_ids, match_all = True, use_arrays = False).order_by('-id')),
+                ('all: tag_ids @>',
+                 base.with_tags(tag_ids, match_all = True, use_arrays = True).order_by('-id')),
+            ]
+            for label, queryset in cases:
+                rows, timings = time_queryset(queryset[page], options['repeat'])
+                self.stdout.write(format_timings(label, rows, timings))
@@ -0,0 +1,137 @@
+"""
+    Django management command generating or loading large datasets fast
+"""
+
+import os
+import random
+import time
+from contextlib import nullcontext
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from core.benchmarking import analyze
+from core.models import Recipe
+from core.search import recipe_search_vector
+from core.seeding import TABLES, BulkLoader, Dumper, Generator
+from recipe.stats import rebuild
+
+
+class Command(BaseCommand):
+    """Generate synthetic users, tags, recipes and links, or load dumped ones.
+
+    Rows go in with COPY inside one transaction, with the plain indexes of
+    the tables dropped and rebuilt once at the end. Every generated user
+    shares a single precomputed password hash. Search vectors and the
+    statistics rollup of the new recipes are filled in before committing.
+    """
+
+    help = 'Bulk seed users, tags, recipes and tag links with COPY, reporting rows per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=100, help='Recipes per user')
+        parser.add_argument('--tags', type=int, default=20, help='Tags per user')
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help='Emails are <prefix>-<n>@example.com')
+        parser.add_argument('--password', default='seed-pass')
+        parser.add_argument('--tokens', action='store_true', help='Create an API token per user')
+        parser.add_argument('--batch-size', type=int, default=20000, help='Recipes per COPY round')
+        parser.add_argument('--no-defer-indexes', action='store_false', dest='defer_indexes',
+                            help='Keep indexes during the load, faster for loads small next to the tables')
+        parser.add_argument('--maintenance-work-mem', default='256MB',
+                            help='Memory for rebuilding the deferred indexes')
+        parser.add_argument('--dump', metavar='DIR',
+                            help='Write CSV files per table instead of loading, with ids from 1')
+        parser.add_argument('--load', metavar='DIR',
+                            help='Load CSV files written by --dump into a database without those ids')
+
+    def handle(self, *args, **options):
+        if options['dump'] and options['load']:
+            raise CommandError('Use either --dump or --load')
+        self.loader = BulkLoader()
+        if options['load'] and not self.loader.copy:
+            raise CommandError('--load needs PostgreSQL COPY')
+
+        started = time.perf_counter()
+        if options['load']:
+            rows = self._load(options)
+        else:
+            existing = get_user_model().objects.filter(email__startswith = f"{options['prefix']}-")
+            if not options['dump'] and existing.exists():
+                raise CommandError(f"Users with prefix {options['prefix']!r} exist, pick another --prefix")
+            generator = Generator(
+                random.Random(options['seed']), options['prefix'], options['password'],
+                options['tags'], options['recipes'], options['tags_per_recipe'], options['tokens'],
+                after_existing = not options['dump'],
+            )
+            if options['dump']:
+                rows = self._dump(generator, options)
+            else:
+                rows = self._load(options, generator)
+
+        self._report('total', rows, time.perf_counter() - started)
+
+    def _report(self, label, rows, seconds):
+        rate = rows / seconds if seconds else 0
+        self.stdout.write(f'{label:<16} {rows:>10} rows {seconds:>8.1f}s {rate:>10.0f} rows/s')
+
+    def _dump(self, generator, options):
+        dumper = Dumper(options['dump'])
+        rows, started = 0, time.perf_counter()
+        try:
+            for batch in generator.batches(options['users'], options['batch_size']):
+                rows += sum(dumper.write(model, columns, batch[model]) for model, columns in TABLES)
+        finally:
+            dumper.close()
+        self._report('generate + dump', rows, time.perf_counter() - started)
+        return rows
+
+    def _copy_files(self, directory):
+        rows = 0
+        for model, columns in TABLES:
+            path = os.path.join(directory, f'{model._meta.db_table}.csv')
+            if not os.path.exists(path):
+                continue
+            with open(path, newline = '') as stream:
+                header = stream.readline().strip().split(',')
+                if header != columns:
+                    raise CommandError(f'{path} has columns {header}, expected {columns}')
+                rows += self.loader.copy_file(model, columns, stream)
+        return rows
+
+    def _load(self, options, generator = None):
+        deferred = (self.loader.deferred_indexes(options['maintenance_work_mem'])
+                    if options['defer_indexes'] else nullcontext([]))
+
+        with transaction.atomic():
+            with deferred as indexes:
+                started = time.perf_counter()
+                if generator is None:
+                    rows = self._copy_files(options['load'])
+                else:
+                    rows = 0
+                    for batch in generator.batches(options['users'], options['batch_size']):
+                        rows += sum(self.loader.write(model, columns, batch[model])
+                                    for model, columns in TABLES)
+                self._report('copy', rows, time.perf_counter() - started)
+
+                started = time.perf_counter()
+                fresh = Recipe.objects.filter(search_vector__isnull = True)
+                user_ids = list(fresh.order_by().values_list('user_id', flat = True).distinct())
+                vectors = fresh.update(search_vector = recipe_search_vector(Recipe.tags.through))
+                self._report('search vectors', vectors, time.perf_counter() - started)
+                started = time.perf_counter()
+
+            if indexes:
+                self._report(f'{len(indexes)} indexes', rows, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            self.loader.reset_sequences()
+            rebuild(user_ids)
+            self._report('statistics', vectors, time.perf_counter() - started)
+
+        analyze()
+        return rows
@@ -0,0 +1,68 @@
+"""
+    Django management command checking the denormalized recipe tag arrays
+"""
+
+from django.core.management import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import F, Q
+
+from core.models import Recipe, tag_array
+from recipe.caching import bump_catalog_version
+
+
+class Command(BaseCommand):
+    """Compare Recipe.tag_ids/tag_names with the tags table, optionally repairing.
+
+    Recipes are scanned in primary key ranges of --batch-size, so the check
+    can run against a live database. Without --repair, drift is an error,
+    which makes the command usable from cron and monitoring.
+    """
+
+    help = 'Find (and with --repair fix) recipes whose tag arrays drifted from their tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def drifted(self, start, stop):
+        """(id, user_id) of recipes in [start, stop) whose arrays are stale"""
+
+        through = Recipe.tags.through
+        return list(
+            Recipe.objects
+            .filter(id__gte = start, id__lt = stop)
+            .annotate(
+                expected_ids = tag_array(through, 'tag_id', models.BigIntegerField()),
+                expected_names = tag_array(through, 'tag__name', models.CharField(max_length = 255)),
+            )
+            .filter(~Q(tag_ids = F('expected_ids')) | ~Q(tag_names = F('expected_names')))
+            .values_list('id', 'user_id')
+        )
+
+    def handle(self, *args, **options):
+        bounds = Recipe.objects.aggregate(first = models.Min('id'), last = models.Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No recipes to check.')
+            return
+
+        drift = 0
+        for start in range(bounds['first'], bounds['last'] + 1, options['batch_size']):
+            rows = self.drifted(start, start + options['batch_size'])
+            if not rows:
+                continue
+            drift += len(rows)
+            ids = [recipe_id for recipe_id, _ in rows]
+            self.stdout.write(f'Out of sync: {", ".join(map(str, ids))}')
+
+            if options['repair']:
+                with transaction.atomic():
+                    Recipe.objects.filter(id__in = ids).refresh_derived_fields()
+                    for user_id in {user_id for _, user_id in rows}:
+                        bump_catalog_version(user_id)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All recipe tag arrays are in sync.'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {drift} recipes.'))
+        else:
+            raise CommandError(f'{drift} recipes have stale tag arrays, rerun with --repair.')
@@ -0,0 +1,88 @@
+"""
+    Django management command load testing a running API server
+"""
+
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management import BaseCommand, CommandError
+
+
+def _client(url, headers, deadline, latencies, errors, lock):
+    """Send requests over one keep-alive connection until the deadline"""
+
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    conn = conn_class(parts.netloc, timeout = 30)
+    own_latencies, own_errors = [], 0
+
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers = headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            own_errors += 1
+            conn.close()
+            continue
+        if response.status >= 400:
+            own_errors += 1
+        else:
+            own_latencies.append(time.perf_counter() - start)
+
+    conn.close()
+    with lock:
+        latencies.extend(own_latencies)
+        errors.append(own_errors)
+
+
+class Command(BaseCommand):
+    """Hammer GET endpoints with concurrent keep-alive clients.
+
+    Meant for comparing deployments (runserver, gunicorn WSGI, uvicorn ASGI)
+    of the same database, so nothing is seeded here.
+    """
+
+    help = 'Load test GET endpoints, reporting requests per second and latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs = '+')
+        parser.add_argument('--token', help = 'API token sent as "Authorization: Token <token>"')
+        parser.add_argument('--clients', type = int, default = 32)
+        parser.add_argument('--duration', type = float, default = 10)
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f"Token {options['token']}"
+
+        for url in options['urls']:
+            if urlsplit(url).scheme not in ('http', 'https'):
+                raise CommandError(f'Not an http(s) url: {url}')
+
+            latencies, errors, lock = [], [], threading.Lock()
+            deadline = time.monotonic() + options['duration']
+            threads = [
+                threading.Thread(target = _client, args = (url, headers, deadline, latencies, errors, lock))
+                for _ in range(options['clients'])
+            ]
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - start
+
+            if len(latencies) < 2:
+                raise CommandError(f'Too few successful responses from {url}')
+            cuts = statistics.quantiles(latencies, n = 100)
+            self.stdout.write(
+                f'{url}: {len(latencies) / elapsed:.0f} req/s, '
+                f'p50 {cuts[49] * 1000:.1f}ms, p99 {cuts[98] * 1000:.1f}ms, '
+                f'{sum(errors)} errors ({options["clients"]} clients, {elapsed:.1f}s)'
+            )
@@ -0,0 +1,34 @@
+"""
+    Django management command rebuilding the recipe statistics rollup
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from recipe.stats import rebuild
+
+
+class Command(BaseCommand):
+    """Recompute RecipeStat rows from the recipes with grouped aggregates.
+
+    Needed after changing RECIPE_STATS_PRICE_BUCKETS or writing recipes
+    behind the ORM's back; the rollup is otherwise kept current on writes.
+    """
+
+    help = 'Rebuild the per-user recipe statistics rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='emails',
+                            help='Only rebuild this user (email), repeatable')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['emails']:
+            users = get_user_model().objects.filter(email__in = options['emails'])
+            user_ids = list(users.values_list('id', flat = True))
+            if len(user_ids) != len(set(options['emails'])):
+                raise CommandError('Unknown user email given')
+
+        rebuild(user_ids)
+        scope = f'{len(user_ids)} users' if user_ids is not None else 'all users'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recipe statistics for {scope}.'))
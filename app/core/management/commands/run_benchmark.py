@@ -0,0 +1,266 @@
+"""
+    Django management command benchmarking every recipe and user endpoint
+"""
+
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.instrumentation import measuring
+from core.management.commands.seed_benchmark import benchmark_email
+from core.models import Recipe, Tag
+
+
+class Scenario:
+    """One request shape; ``path`` and ``body`` are called before the clock starts"""
+
+    def __init__(self, name, method, path, body = None, content_type = 'application/json'):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+
+
+def _recipe_body(ctx, index):
+    return {
+        'title': f'benchmark recipe {index}',
+        'time_minutes': 10 + index % 50,
+        'price': '12.50',
+        'tags': [{'name': name} for name in ctx.tag_names[index % len(ctx.tag_names):][:3]],
+    }
+
+
+def _import_body(ctx, index):
+    return '\n'.join(json.dumps(_recipe_body(ctx, index * 10 + line)) for line in range(10))
+
+
+def _throwaway_recipe(ctx, index):
+    recipe = Recipe.objects.create(user = ctx.user, title = f'delete me {index}', time_minutes = 1, price = 1)
+    return reverse('recipe:recipe-detail', args = [recipe.id])
+
+
+def _throwaway_tag(ctx, index):
+    tag = Tag.objects.create(user = ctx.user, name = f'benchmark-delete-{index}')
+    return reverse('recipe:tag-detail', args = [tag.id])
+
+
+SCENARIOS = [
+    Scenario('user:create', 'post', lambda ctx, i: reverse('user:create'),
+             lambda ctx, i: {'email': f'benchmark-new-{i}@example.com', 'password': 'benchmark', 'name': 'New'}),
+    Scenario('user:token', 'post', lambda ctx, i: reverse('user:token'),
+             lambda ctx, i: {'email': ctx.user.email, 'password': ctx.password}),
+    Scenario('user:me', 'get', lambda ctx, i: reverse('user:me')),
+    Scenario('user:me patch', 'patch', lambda ctx, i: reverse('user:me'),
+             lambda ctx, i: {'name': f'Benchmark {i}'}),
+    Scenario('recipe:recipe-list', 'get', lambda ctx, i: reverse('recipe:recipe-list')),
+    Scenario('recipe:recipe-list tags', 'get',
+             lambda ctx, i: f"{reverse('recipe:recipe-list')}?tags={ctx.tag_ids[0]},{ctx.tag_ids[1]}"),
+    Scenario('recipe:recipe-list tags all', 'get',
+             lambda ctx, i: f"{reverse('recipe:recipe-list')}?tags={ctx.tag_ids[0]},{ctx.tag_ids[1]}&match=all"),
+    Scenario('recipe:recipe-list search', 'get',
+             lambda ctx, i: f"{reverse('recipe:recipe-list')}?q=spicy+curry"),
+    Scenario('recipe:recipe-list create', 'post', lambda ctx, i: reverse('recipe:recipe-list'), _recipe_body),
+    Scenario('recipe:recipe-detail', 'get',
+             lambda ctx, i: reverse('recipe:recipe-detail', args = [ctx.recipe_ids[i % len(ctx.recipe_ids)]])),
+    Scenario('recipe:recipe-detail patch', 'patch',
+             lambda ctx, i: reverse('recipe:recipe-detail', args = [ctx.recipe_ids[i % len(ctx.recipe_ids)]]),
+             lambda ctx, i: {'title': f'benchmark title {i}'}),
+    Scenario('recipe:recipe-detail delete', 'delete', _throwaway_recipe),
+    Scenario('recipe:recipe-import', 'post', lambda ctx, i: reverse('recipe:recipe-bulk-import'),
+             _import_body, 'application/x-ndjson'),
+    Scenario('recipe:recipe-export', 'get', lambda ctx, i: reverse('recipe:recipe-export')),
+    Scenario('recipe:stats', 'get', lambda ctx, i: reverse('recipe:stats')),
+    Scenario('recipe:tag-list', 'get', lambda ctx, i: reverse('recipe:tag-list')),
+    Scenario('recipe:tag-list counts', 'get',
+             lambda ctx, i: f"{reverse('recipe:tag-list')}?with_recipe_count=1&ordering=-recipe_count"),
+    Scenario('recipe:tag-detail patch', 'patch',
+             lambda ctx, i: reverse('recipe:tag-detail', args = [ctx.tag_ids[i % len(ctx.tag_ids)]]),
+             lambda ctx, i: {'name': f'benchmark-tag-{i}'}),
+    Scenario('recipe:tag-detail delete', 'delete', _throwaway_tag),
+]
+
+
+class Context:
+    """The benchmark user and the ids the scenarios pick from"""
+
+    def __init__(self, user, password):
+        self.user = user
+        self.password = password
+        self.recipe_ids = list(Recipe.objects.filter(user = user).order_by('id').values_list('id', flat = True))
+        tags = Tag.objects.filter(user = user).order_by('id')
+        self.tag_ids = list(tags.values_list('id', flat = True))
+        self.tag_names = list(tags.values_list('name', flat = True))
+
+
+def _summary(timings, statuses, queries, db_timings):
+    cuts = statistics.quantiles(timings, n = 100) if len(timings) > 1 else timings * 99
+    return {
+        'requests': len(timings),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'status': max(set(statuses), key = statuses.count),
+        'queries': max(queries),
+        'db_mean_ms': round(statistics.mean(db_timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(cuts[49], 3),
+        'p90_ms': round(cuts[89], 3),
+        'p99_ms': round(cuts[98], 3),
+        'throughput_rps': round(len(timings) / (sum(timings) / 1000), 1),
+    }
+
+
+def compare(baseline, current, threshold, min_delta_ms):
+    """Endpoints whose p50 grew by more than threshold percent and min_delta_ms,
+    or that run more queries"""
+
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if (result['p50_ms'] > before['p50_ms'] * (1 + threshold / 100)
+                and result['p50_ms'] - before['p50_ms'] > min_delta_ms):
+            regressions.append(f"{name}: p50 {before['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+    return regressions
+
+
+class Command(BaseCommand):
+    """Measure latency percentiles, query counts and throughput per endpoint.
+
+    Requests go through the full middleware stack in process, one at a
+    time, as the user seeded by seed_benchmark. Everything runs in a
+    transaction that is rolled back, so writes do not accumulate between
+    runs. Concurrency is load_test's job, against a running server.
+    """
+
+    help = 'Benchmark the recipe and user endpoints and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default=benchmark_email('benchmark', 0))
+        parser.add_argument('--password', default='benchmark-pass')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', default=[], help='Run endpoints whose name contains any of these')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the response and token caches before every request')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Fail on regressions against this earlier JSON result')
+        parser.add_argument('--threshold', type=float, default=20, help='Allowed p50 growth in percent')
+        parser.add_argument('--min-delta-ms', type=float, default=1,
+                            help='p50 growth below this is noise, whatever the percentage')
+        parser.add_argument('--label', default='', help='Free text stored with the results')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['warmup'] < 1:
+            raise CommandError('--requests and --warmup must be at least 1')
+        user = get_user_model().objects.filter(email = options['user']).first()
+        if user is None:
+            raise CommandError(f"No user {options['user']}, run seed_benchmark first")
+        ctx = Context(user, options['password'])
+        if not ctx.recipe_ids or len(ctx.tag_ids) < 2:
+            raise CommandError(f'{user.email} needs recipes and at least two tags')
+
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not options['only'] or any(part in scenario.name for part in options['only'])]
+        client = Client(HTTP_AUTHORIZATION = f'Token {Token.objects.get_or_create(user = user)[0].key}')
+
+        results = {}
+        # Sampling is off so every request's queries land in the benchmark's own measurement.
+        # Throttles still run, at rates no scenario reaches.
+        rates = {scope: '1000000/min' for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+        overrides = override_settings(
+            ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver'],
+            INSTRUMENTATION_SAMPLE_RATE = 0,
+            REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates},
+        )
+        with overrides, transaction.atomic():
+            for scenario in scenarios:
+                results[scenario.name] = self._run(client, ctx, scenario, options)
+                self.stdout.write(self._format(scenario.name, results[scenario.name]))
+            transaction.set_rollback(True)
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'label': options['label'],
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'settings': {name: getattr(settings, name) for name in (
+                    'RECIPE_FAST_LIST', 'RECIPE_TAG_ARRAYS', 'RECIPE_SEARCH_TRIGRAM',
+                )},
+            },
+            'dataset': {
+                'user': user.email,
+                'recipes': len(ctx.recipe_ids),
+                'tags': len(ctx.tag_ids),
+            },
+            'options': {name: options[name] for name in ('requests', 'warmup', 'cold')},
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent = 2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                regressions = compare(json.load(baseline)['endpoints'], results,
+                                      options['threshold'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError('Regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def _request(self, client, ctx, scenario, index, cold):
+        path = scenario.path(ctx, index)
+        kwargs = {}
+        if scenario.body is not None:
+            body = scenario.body(ctx, index)
+            kwargs = {'data': body if isinstance(body, str) else json.dumps(body),
+                      'content_type': scenario.content_type}
+        if cold:
+            caches[settings.RESPONSE_CACHE].clear()
+            caches[settings.TOKEN_AUTH_CACHE].clear()
+
+        with measuring() as metrics:
+            start = time.perf_counter()
+            response = getattr(client, scenario.method)(path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, response.status_code, metrics
+
+    def _run(self, client, ctx, scenario, options):
+        for index in range(options['warmup']):
+            self._request(client, ctx, scenario, index, options['cold'])
+
+        timings, statuses, queries, db_timings = [], [], [], []
+        for index in range(options['warmup'], options['warmup'] + options['requests']):
+            elapsed, status, metrics = self._request(client, ctx, scenario, index, options['cold'])
+            timings.append(elapsed)
+            statuses.append(status)
+            queries.append(metrics.queries)
+            db_timings.append(metrics.db * 1000)
+        return _summary(timings, statuses, queries, db_timings)
+
+    def _format(self, name, result):
+        line = (f"{name:<30} p50={result['p50_ms']:.2f}ms p90={result['p90_ms']:.2f}ms "
+                f"p99={result['p99_ms']:.2f}ms {result['throughput_rps']:.0f} req/s "
+                f"queries={result['queries']} status={result['status']}")
+        if result['errors']:
+            return self.style.ERROR(f"{line} errors={result['errors']}")
+        return line
@@ -0,0 +1,120 @@
+"""
+    Django management command running the production app server
+"""
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from gunicorn.app.base import BaseApplication
+
+from core.checks import check_shared_caches
+from core.serving import (
+    DEFAULT_THREADS, DEFAULT_WORKER_MEMORY_MB, available_cpus, available_memory,
+    thread_count, worker_count,
+)
+
+
+class Server(BaseApplication):
+    """Gunicorn application serving app.wsgi (or app.asgi) with fixed options"""
+
+    def __init__(self, options, asgi = False):
+        self.options = options
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.asgi:
+            from app.asgi import application
+        else:
+            from app.wsgi import application
+
+        # Workers must not inherit the master's database sockets
+        connections.close_all()
+        return application
+
+
+class Command(BaseCommand):
+    """Serve the app with gunicorn, sized to the machine.
+
+    Workers default to 2 * CPUs + 1, capped by how many fit in memory, each
+    running a thread pool. The app is imported once in the master before
+    forking, so workers share its memory copy-on-write.
+
+    Signals to the master (see --pid):
+      HUP   re-read options and gracefully replace the workers
+      USR2  start a new master with fresh code, then TERM the old one
+      TERM  finish in-flight requests and exit
+
+    USR2 is the only way to load new code. manage.py has set up Django in
+    the master before gunicorn starts, so even with --no-preload the
+    settings, models, signal handlers and most app modules are already
+    imported there and HUP would leave workers mixing old and new code.
+    """
+
+    help = 'Run the production gunicorn server (use runserver for development)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='0.0.0.0:8000')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Worker processes (default: sized from CPUs and memory)')
+        parser.add_argument('--threads', type=int, default=0,
+                            help=f'Threads per worker (default: {DEFAULT_THREADS}, more if workers were capped)')
+        parser.add_argument('--worker-memory', type=int, default=DEFAULT_WORKER_MEMORY_MB,
+                            help='Expected memory per worker in MiB, used for sizing')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Serve app.asgi with uvicorn workers, one per CPU')
+        parser.add_argument('--no-preload', action='store_false', dest='preload',
+                            help='Import the app in each worker instead of the master; costs memory, '
+                                 'does not make HUP reload code, use USR2 for that')
+        parser.add_argument('--max-requests', type=int, default=1000,
+                            help='Recycle a worker after this many requests (0 disables)')
+        parser.add_argument('--timeout', type=int, default=30)
+        parser.add_argument('--graceful-timeout', type=int, default=30)
+        parser.add_argument('--pid', help='Write the master pid to this file')
+        parser.add_argument('--print-config', action='store_true',
+                            help='Print the resolved options and exit')
+
+    def get_options(self, options):
+        """Resolve the gunicorn settings from command options"""
+
+        cpus = available_cpus()
+        if options['asgi']:
+            workers = options['workers'] or cpus
+            server = {'worker_class': 'uvicorn.workers.UvicornWorker'}
+        else:
+            workers = options['workers'] or worker_count(
+                cpus, available_memory(), options['worker_memory'])
+            server = {
+                'worker_class': 'gthread',
+                'threads': options['threads'] or thread_count(cpus, workers),
+            }
+
+        return {
+            'bind': options['bind'],
+            'workers': workers,
+            **server,
+            'preload_app': options['preload'],
+            'max_requests': options['max_requests'],
+            'max_requests_jitter': options['max_requests'] // 10,
+            'timeout': options['timeout'],
+            'graceful_timeout': options['graceful_timeout'],
+            'pidfile': options['pid'],
+            'accesslog': '-',
+        }
+
+    def handle(self, *args, **options):
+        server_options = self.get_options(options)
+        if options['print_config']:
+            for key, value in server_options.items():
+                self.stdout.write(f'{key} = {value!r}')
+            return
+
+        if server_options['workers'] > 1:
+            errors = check_shared_caches(None)
+            if errors:
+                raise CommandError('\n'.join(f'{error.id}: {error.msg} {error.hint}' for error in errors))
+
+        Server(server_options, asgi = options['asgi']).run()
@@ -3,24 +3,59 @@
 """
 
 import time
-from typing import Any
 
 from psycopg2 import OperationalError as psycopg2Error
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
 class Command(BaseCommand):
     """Django command to wait for database to be available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Database alias to wait for, repeatable (default: every configured alias)',
+        )
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Give up after this many seconds (0 waits forever)')
+        parser.add_argument('--max-attempts', type=int, default=0,
+                            help='Give up after this many attempts (0 means unlimited)')
+        parser.add_argument('--backoff', type=float, default=0.5,
+                            help='Initial delay between attempts, doubled each time')
+        parser.add_argument('--max-backoff', type=float, default=5,
+                            help='Upper bound for the delay between attempts')
+
     def handle(self, *args, **options):
         self.stdout.write('Waiting for Database Connection...')
-        is_db_connected = False 
+        databases = options['databases'] or list(connections)
+        deadline = time.monotonic() + options['timeout'] if options['timeout'] else None
+        delay = options['backoff']
+        attempt = 0
 
-        while is_db_connected == False:
+        while True:
+            attempt += 1
             try:
-                self.check(databases=['default'])
-                is_db_connected = True 
+                self.check(databases=databases)
+                self._ping(databases)
+                break
             except (psycopg2Error, OperationalError):
-                self.stdout.write('Database not available yet, waiting for 1 sec...')
-                time.sleep(1)
-        self.stdout.write(self.style.SUCCESS('Database active and connected!'))
\ No newline at end of file
+                pass
+
+            if options['max_attempts'] and attempt >= options['max_attempts']:
+                raise CommandError(f'Database not available after {attempt} attempts')
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise CommandError(f"Database not available after {options['timeout']} seconds")
+
+            self.stdout.write(f'Database not available yet, waiting for {delay:g} sec...')
+            time.sleep(delay)
+            delay = min(delay * 2, options['max_backoff'])
+
+        self.stdout.write(self.style.SUCCESS('Database active and connected!'))
+
+    def _ping(self, databases):
+        """Run a query on each alias, through any pooler in front of it"""
+
+        for alias in databases:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
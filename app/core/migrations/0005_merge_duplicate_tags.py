@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Fold tags sharing a (user, name) pair into the oldest one"""
+
+    Tag = apps.get_model('core', 'Tag')
+    Through = apps.get_model('core', 'Recipe').tags.through
+
+    duplicates = (
+        Tag.objects.values('user_id', 'name')
+        .annotate(keep_id=models.Min('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for dup in duplicates:
+        extra_ids = list(
+            Tag.objects.filter(user_id=dup['user_id'], name=dup['name'])
+            .exclude(id=dup['keep_id'])
+            .values_list('id', flat=True)
+        )
+        tagged = set(
+            Through.objects.filter(tag_id=dup['keep_id'])
+            .values_list('recipe_id', flat=True)
+        )
+        moved = set(
+            Through.objects.filter(tag_id__in=extra_ids)
+            .values_list('recipe_id', flat=True)
+        ) - tagged
+        Through.objects.bulk_create([
+            Through(recipe_id=recipe_id, tag_id=dup['keep_id'])
+            for recipe_id in moved
+        ])
+        Tag.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_rename_tag_recipe_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Composite indexes for the recipe list and tag filter queries.
+
+    Tag listings are already served by the (user, name) unique constraint.
+    Indexes are built concurrently so large tables stay writable.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_tag_unique_tag_name_per_user'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+        ),
+        # The auto-created through table is not a model we can put Meta.indexes on
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "recipe_tags_tag_recipe_idx" '
+            'ON "core_recipe_tags" ("tag_id", "recipe_id");',
+            'DROP INDEX CONCURRENTLY IF EXISTS "recipe_tags_tag_recipe_idx";',
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_tag_arrays(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+
+    def tag_array(field, base_field):
+        values = Subquery(
+            Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'))
+            .values('recipe_id')
+            .annotate(values=ArrayAgg(field, ordering=('tag__name', 'tag_id')))
+            .values('values')
+        )
+        return Coalesce(values, Value([]), output_field=ArrayField(base_field))
+
+    Recipe.objects.filter(tags__isnull=False).distinct().update(
+        tag_ids=tag_array('tag_id', models.BigIntegerField()),
+        tag_names=tag_array('tag__name', models.CharField(max_length=255)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_ids',
+            field=ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_names',
+            field=ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunPython(populate_tag_arrays, migrations.RunPython.noop),
+    ]
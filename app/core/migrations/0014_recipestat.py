@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+import django.db.models.deletion
+
+
+def populate_recipe_stats(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeStat = apps.get_model('core', 'RecipeStat')
+
+    edges = [0] + [int(Decimal(edge) * 100) for edge in settings.RECIPE_STATS_PRICE_BUCKETS]
+    bucket = Case(
+        *[When(price__gte=Decimal(edge) / 100, then=Value(edge)) for edge in reversed(edges)],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    groups = [
+        ('time', Recipe.objects.values_list('user_id', 'time_minutes')),
+        ('price', Recipe.objects.annotate(bucket=bucket).values_list('user_id', 'bucket')),
+        ('tag', Recipe.tags.through.objects.values_list('recipe__user_id', 'tag_id')),
+    ]
+    for dimension, grouped in groups:
+        RecipeStat.objects.bulk_create(
+            [RecipeStat(user_id=user_id, dimension=dimension, key=key, count=count)
+             for user_id, key, count in grouped.order_by().annotate(count=Count('*'))],
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_tag_ids_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('time', 'Time in minutes'), ('price', 'Price bucket'), ('tag', 'Tag')], max_length=8)),
+                ('key', models.BigIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='recipestat',
+            constraint=models.UniqueConstraint(fields=('user', 'dimension', 'key'), name='unique_recipe_stat'),
+        ),
+        migrations.RunPython(populate_recipe_stats, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,11 @@
 """
 
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -11,6 +16,8 @@ from django.contrib.auth.models import (
 
 from django.conf import settings
 
+from core.search import SEARCH_CONFIG, TrigramWordSimilarity, recipe_search_vector, trigram_enabled
+
 class UserManager(BaseUserManager):
 
     def create_user(self, email, password=None, super_user = False, **extra_fields):
@@ -46,6 +53,30 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD =  "email"
     
 
+class TagManager(models.Manager):
+
+    def get_or_create_many(self, user, names):
+        """Return a {name: tag} map for the user, creating missing tags in bulk"""
+
+        names = set(names)
+        if not names:
+            return {}
+
+        tags = {tag.name: tag for tag in self.filter(user = user, name__in = names)}
+        missing = names - tags.keys()
+        if missing:
+            # Conflicts are tags created by a concurrent request in the meantime
+            self.bulk_create(
+                [self.model(user = user, name = name) for name in missing],
+                ignore_conflicts = True
+            )
+            tags.update(
+                (tag.name, tag)
+                for tag in self.filter(user = user, name__in = missing)
+            )
+        return tags
+
+
 class Tag(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -53,10 +84,100 @@ class Tag(models.Model):
     )
 
     name = models.CharField(max_length = 255)
+    created_at = models.DateTimeField(auto_now_add = True)
+    updated_at = models.DateTimeField(auto_now = True)
+
+    objects = TagManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['user', 'name'],
+                name = 'unique_tag_name_per_user'
+            ),
+        ]
 
     def __str__(self):
         return self.name
     
+def tag_array(through, field, base_field):
+    """Array of a recipe's tag ids or names ordered by tag name, empty if untagged"""
+
+    values = models.Subquery(
+        through.objects.filter(recipe_id = models.OuterRef('pk'))
+        .values('recipe_id')
+        .annotate(values = ArrayAgg(field, ordering = ('tag__name', 'tag_id')))
+        .values('values')
+    )
+    return Coalesce(values, models.Value([]), output_field = ArrayField(base_field))
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_tags(self, tag_ids, match_all = False, use_arrays = None):
+        """Filter recipes tagged with any (or all) of the given tag ids
+
+        With arrays (RECIPE_TAG_ARRAYS by default) the denormalized tag_ids
+        are matched with && / @> on their GIN index. Otherwise both forms are
+        semi-joins on the through table, so no DISTINCT is needed over the
+        recipe rows.
+        """
+
+        tag_ids = set(tag_ids)
+        if use_arrays is None:
+            use_arrays = settings.RECIPE_TAG_ARRAYS
+        if use_arrays:
+            lookup = 'tag_ids__contains' if match_all else 'tag_ids__overlap'
+            return self.filter(**{lookup: sorted(tag_ids)})
+
+        links = self.model.tags.through.objects.filter(tag_id__in = tag_ids)
+
+        if match_all:
+            matching = (links.values('recipe_id')
+                        .annotate(matched = models.Count('tag_id'))
+                        .filter(matched = len(tag_ids))
+                        .values('recipe_id'))
+            return self.filter(id__in = matching)
+
+        return self.filter(models.Exists(links.filter(recipe_id = models.OuterRef('pk'))))
+
+    def search(self, text):
+        """Rank recipes matching the text, best full-text matches first
+
+        With RECIPE_SEARCH_TRIGRAM enabled and pg_trgm installed, titles
+        containing a word similar to the text (typos, prefixes) also match
+        and rank after full-text hits.
+        """
+
+        query = SearchQuery(text, config = SEARCH_CONFIG, search_type = 'websearch')
+        condition = models.Q(search_vector = query)
+        similarity = models.Value(0.0, output_field = models.FloatField())
+        if trigram_enabled(self.db):
+            condition |= models.Q(title__trigram_word_similar = text)
+            similarity = TrigramWordSimilarity(text, 'title')
+
+        return (self.filter(condition)
+                .annotate(rank = SearchRank(models.F('search_vector'), query),
+                          similarity = similarity)
+                .order_by('-rank', '-similarity', '-id'))
+
+    def refresh_search_vectors(self):
+        """Recompute the stored search vectors only, for text edits that leave the tags alone"""
+
+        return self.update(search_vector = recipe_search_vector(self.model.tags.through))
+
+    def refresh_derived_fields(self, **fields):
+        """Recompute the stored search vectors and tag arrays, updating any extra fields too"""
+
+        through = self.model.tags.through
+        return self.update(
+            search_vector = recipe_search_vector(through),
+            tag_ids = tag_array(through, 'tag_id', models.BigIntegerField()),
+            tag_names = tag_array(through, 'tag__name', models.CharField(max_length = 255)),
+            **fields
+        )
+
+
 class Recipe(models.Model):
 
     user = models.ForeignKey(
@@ -70,7 +191,56 @@ class Recipe(models.Model):
     price = models.DecimalField(max_digits = 5, decimal_places = 2)
     link = models.CharField(max_length=255, blank = True)
     tags = models.ManyToManyField(Tag)
+    created_at = models.DateTimeField(auto_now_add = True)
+    updated_at = models.DateTimeField(auto_now = True)
+    search_vector = SearchVectorField(null = True, editable = False)
+    # Copies of the tags ordered by name, kept in sync with refresh_derived_fields()
+    tag_ids = ArrayField(models.BigIntegerField(), default = list, blank = True, editable = False)
+    tag_names = ArrayField(models.CharField(max_length = 255), default = list, blank = True, editable = False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the per-user recipe list ordered newest first
+            models.Index(fields = ['user', '-id'], name = 'recipe_user_id_desc_idx'),
+            # Serves incremental sync with ?updated_since=
+            models.Index(fields = ['user', 'updated_at'], name = 'recipe_user_updated_at_idx'),
+            GinIndex(fields = ['search_vector'], name = 'recipe_search_vector_idx'),
+            # Serves ?tags= filtering with && (any) and @> (all)
+            GinIndex(fields = ['tag_ids'], name = 'recipe_tag_ids_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+
+
+class RecipeStat(models.Model):
+    """One bucket of a user's recipe rollup, maintained by recipe.stats.
+
+    Rows count recipes per exact ``time_minutes`` value, per price bucket
+    (keyed by its lower bound in cents) and per tag id, so dashboards never
+    scan the recipes themselves.
+    """
+
+    TIME = 'time'
+    PRICE = 'price'
+    TAG = 'tag'
+    DIMENSIONS = [(TIME, 'Time in minutes'), (PRICE, 'Price bucket'), (TAG, 'Tag')]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete = models.CASCADE
+    )
+    dimension = models.CharField(max_length = 8, choices = DIMENSIONS)
+    key = models.BigIntegerField()
+    count = models.IntegerField(default = 0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['user', 'dimension', 'key'],
+                name = 'unique_recipe_stat'
+            ),
+        ]
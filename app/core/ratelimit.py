@@ -0,0 +1,64 @@
+"""
+    Failed login counting per email and client IP
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+class LoginRateLimiter:
+    """Refuse logins for an email or IP with too many recent failures.
+
+    Failures are counted in fixed windows of LOGIN_RATE_LIMIT_WINDOW seconds
+    in the LOGIN_RATE_LIMIT_CACHE; point it at a shared backend when running
+    several processes. The check happens before the password is hashed, so
+    refused attempts cost no hashing CPU. A successful login clears the
+    email's count but not the IP's.
+    """
+
+    def __init__(self, request, email):
+        self.cache = caches[settings.LOGIN_RATE_LIMIT_CACHE]
+        self.window = settings.LOGIN_RATE_LIMIT_WINDOW
+        now = time.time()
+        self.wait_seconds = self.window - now % self.window
+        bucket = int(now // self.window)
+
+        # The client IP honours REST_FRAMEWORK NUM_PROXIES like DRF's throttles
+        limits = [('ip', BaseThrottle().get_ident(request), settings.LOGIN_RATE_LIMIT_PER_IP)]
+        if isinstance(email, str) and email:
+            limits.append(('email', email.strip().lower(), settings.LOGIN_RATE_LIMIT_PER_EMAIL))
+        self.limits = {
+            self._key(scope, value, bucket): (scope, limit)
+            for scope, value, limit in limits if limit
+        }
+
+    @staticmethod
+    def _key(scope, value, bucket):
+        # Hashed, so emails and addresses never reach the cache in clear
+        return f'login-failures:{scope}:{bucket}:' + hashlib.sha256(str(value).encode()).hexdigest()
+
+    def wait(self):
+        """Seconds until the next attempt is allowed, None if allowed now"""
+
+        counts = self.cache.get_many(list(self.limits))
+        for key, (_, limit) in self.limits.items():
+            if counts.get(key, 0) >= limit:
+                return self.wait_seconds
+        return None
+
+    def failed(self):
+        for key in self.limits:
+            # add() then incr() keeps concurrent failures from overwriting each other
+            self.cache.add(key, 0, self.window)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # Expired between the two calls
+                self.cache.add(key, 1, self.window)
+
+    def succeeded(self):
+        self.cache.delete_many([key for key, (scope, _) in self.limits.items() if scope == 'email'])
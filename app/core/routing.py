@@ -0,0 +1,122 @@
+"""
+    Read replica routing for safe-method requests
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Whether reads of the current request may go to a replica
+_use_replica = contextvars.ContextVar('use_replica', default = False)
+
+
+def _pin_key(request):
+    """Cache key pinning a client to the primary, None for anonymous clients"""
+
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return 'db-pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+@contextmanager
+def primary_reads():
+    """Send the enclosed reads to the primary, whatever the request allows"""
+
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRoutingMiddleware:
+    """Let safe-method requests read from replicas.
+
+    After an unsafe request a client is pinned to the primary for
+    REPLICA_PIN_SECONDS, so it reads its own writes despite replication lag.
+    Clients are identified by their Authorization header. The middleware
+    works under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marking the instance as a coroutine function for the async handler
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        token = _use_replica.set(self._may_use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        self._pin(request)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        # The pin cache is blocking I/O, kept off the event loop
+        token = _use_replica.set(await sync_to_async(self._may_use_replica, thread_sensitive = False)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        await sync_to_async(self._pin, thread_sensitive = False)(request)
+        return response
+
+    def _may_use_replica(self, request):
+        # Without replicas there is nothing to route, the pin cache is left alone
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return False
+        pin_key = _pin_key(request)
+        return not (pin_key and caches[settings.REPLICA_PIN_CACHE].get(pin_key))
+
+    def _pin(self, request):
+        pin_key = _pin_key(request)
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and pin_key:
+            caches[settings.REPLICA_PIN_CACHE].set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter:
+    """Send reads to a random replica when the current request allows it"""
+
+    def db_for_read(self, model, **hints):
+        # Fresh tokens must authenticate before they reach the replicas
+        if model is Token or not settings.DATABASE_REPLICAS:
+            return None
+        if _use_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name = None, **hints):
+        # Replicas receive the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,73 @@
+"""
+    Full-text and trigram search helpers for recipes
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.lookups import PostgresOperatorLookup
+from django.contrib.postgres.search import SearchVector
+from django.db import connections
+from django.db.models import FloatField, Func, OuterRef, Subquery, Value
+
+# Text search configuration used both for the stored vector and for queries
+SEARCH_CONFIG = 'english'
+
+
+class TrigramWordSimilarity(Func):
+    """Greatest similarity between the string and any extent of the expression"""
+
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
+
+
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """``field %> 'text'``, served by a gin_trgm_ops index on the field"""
+
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+@lru_cache(maxsize = None)
+def _has_trigram_extension(alias, name):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def trigram_enabled(alias = 'default'):
+    """RECIPE_SEARCH_TRIGRAM, if the database has pg_trgm installed.
+
+    Migration 0011 skips the extension on servers that do not ship it, so
+    those fall back to full-text search only. The catalog is read once per
+    database.
+    """
+
+    if not settings.RECIPE_SEARCH_TRIGRAM:
+        return False
+    return _has_trigram_extension(alias, connections[alias].settings_dict['NAME'])
+
+
+def recipe_search_vector(through):
+    """Weighted vector over title, description and the recipe's tag names"""
+
+    tag_names = Subquery(
+        through.objects.filter(recipe_id = OuterRef('pk'))
+        .values('recipe_id')
+        .annotate(names = StringAgg('tag__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('title', weight = 'A', config = SEARCH_CONFIG)
+        + SearchVector('description', weight = 'B', config = SEARCH_CONFIG)
+        + SearchVector(tag_names, weight = 'C', config = SEARCH_CONFIG)
+    )
@@ -0,0 +1,213 @@
+"""
+    Bulk loading of synthetic users, tags, recipes and tag links
+"""
+
+import csv
+import io
+import os
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from rest_framework.authtoken.models import Token
+
+from core.benchmarking import random_text
+from core.models import Recipe, Tag
+
+# Table layout of the generated rows and of dumped CSV files, in load order
+TABLES = [
+    (get_user_model(), ['id', 'password', 'last_login', 'is_superuser', 'email', 'name', 'is_active', 'is_staff']),
+    (Token, ['key', 'created', 'user_id']),
+    (Tag, ['id', 'name', 'user_id', 'created_at', 'updated_at']),
+    (Recipe, ['id', 'title', 'description', 'time_minutes', 'price', 'link', 'user_id',
+              'created_at', 'updated_at', 'tag_ids', 'tag_names']),
+    (Recipe.tags.through, ['recipe_id', 'tag_id']),
+]
+
+
+def _array(values):
+    """PostgreSQL array literal, as COPY reads it"""
+
+    quoted = ('"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"' for value in values)
+    return '{' + ','.join(quoted) + '}'
+
+
+def csv_rows(rows):
+    """Rows as COPY reads them: lists as array literals, None as \\N"""
+
+    for row in rows:
+        yield ['\\N' if value is None else _array(value) if isinstance(value, list) else value
+               for value in row]
+
+
+class Generator:
+    """Deterministic synthetic catalog, produced in batches of table rows.
+
+    Ids are assigned here, after the current maximum of each table (or from
+    1 with ``after_existing = False``), so tag links and the denormalized tag
+    arrays can be written without reading anything back. Every user shares
+    one precomputed password hash.
+    """
+
+    def __init__(self, rng, prefix, password, tags_per_user, recipes_per_user, tags_per_recipe,
+                 tokens = False, after_existing = True):
+        self.rng = rng
+        self.prefix = prefix
+        self.password_hash = make_password(password)
+        self.tags_per_user = tags_per_user
+        self.recipes_per_user = recipes_per_user
+        self.tags_per_recipe = min(tags_per_recipe, tags_per_user)
+        self.tokens = tokens
+        self.now = time.strftime('%Y-%m-%d %H:%M:%S+00', time.gmtime())
+
+        def first_id(model):
+            last = model.objects.aggregate(id = Max('id'))['id'] if after_existing else None
+            return (last or 0) + 1
+
+        self.first_user = first_id(get_user_model())
+        self.first_tag = first_id(Tag)
+        self.first_recipe = first_id(Recipe)
+
+        # Tag arrays are ordered by name then id, like refresh_derived_fields()
+        names = [f'tag-{index}' for index in range(tags_per_user)]
+        self.tag_order = {index: position for position, index in
+                          enumerate(sorted(range(tags_per_user), key = lambda index: names[index]))}
+        self.tag_names = names
+
+    def batches(self, users, batch_size):
+        """Yield {model: rows} for about ``batch_size`` recipes at a time"""
+
+        batch = {model: [] for model, _ in TABLES}
+        pending = 0
+        for user in range(users):
+            self._user(user, batch)
+            pending += self.recipes_per_user
+            if pending >= batch_size:
+                yield batch
+                batch = {model: [] for model, _ in TABLES}
+                pending = 0
+        if any(batch.values()):
+            yield batch
+
+    def _user(self, user, batch):
+        rng = self.rng
+        User, through = get_user_model(), Recipe.tags.through
+        user_id = self.first_user + user
+        batch[User].append((user_id, self.password_hash, None, False,
+                            f'{self.prefix}-{user}@example.com', f'User {user}', True, False))
+        if self.tokens:
+            batch[Token].append((Token.generate_key(), self.now, user_id))
+
+        first_tag = self.first_tag + user * self.tags_per_user
+        batch[Tag].extend((first_tag + index, name, user_id, self.now, self.now)
+                          for index, name in enumerate(self.tag_names))
+
+        first_recipe = self.first_recipe + user * self.recipes_per_user
+        for recipe in range(self.recipes_per_user):
+            recipe_id = first_recipe + recipe
+            tags = sorted(rng.sample(range(self.tags_per_user), self.tags_per_recipe),
+                          key = self.tag_order.get)
+            cents = rng.randint(100, 99999)
+            batch[Recipe].append((
+                recipe_id, random_text(rng, 3), random_text(rng, 12), rng.randint(1, 240),
+                f'{cents // 100}.{cents % 100:02d}', '', user_id, self.now, self.now,
+                [first_tag + tag for tag in tags], [self.tag_names[tag] for tag in tags],
+            ))
+            batch[through].extend((recipe_id, first_tag + tag) for tag in tags)
+
+
+class BulkLoader:
+    """Write rows with COPY on PostgreSQL, bulk_create elsewhere"""
+
+    def __init__(self):
+        self.copy = connection.vendor == 'postgresql'
+
+    def write(self, model, columns, rows):
+        if not rows:
+            return 0
+        if not self.copy:
+            model.objects.bulk_create([model(**dict(zip(columns, row))) for row in rows], batch_size = 5000)
+            return len(rows)
+
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(csv_rows(rows))
+        buffer.seek(0)
+        self.copy_file(model, columns, buffer)
+        return len(rows)
+
+    def copy_file(self, model, columns, stream):
+        """COPY a CSV stream into the model's table, returning the row count"""
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {model._meta.db_table} ({", ".join(columns)}) '
+                f"FROM STDIN WITH (FORMAT csv, NULL '\\N')", stream)
+            return cursor.rowcount
+
+    def reset_sequences(self):
+        """Move id sequences past the explicitly written ids"""
+
+        statements = connection.ops.sequence_reset_sql(no_style(), [model for model, _ in TABLES])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    @contextmanager
+    def deferred_indexes(self, maintenance_work_mem = None):
+        """Drop the plain indexes of the loaded tables and rebuild them on exit.
+
+        Indexes backing primary keys and unique constraints stay, they are
+        what keeps the load consistent. Must run inside a transaction, so a
+        failed load gets its indexes back on rollback.
+        """
+
+        if not self.copy:
+            yield []
+            return
+
+        tables = [model._meta.db_table for model, _ in TABLES]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname, indexdef FROM pg_indexes '
+                'WHERE schemaname = current_schema() AND tablename = ANY(%s) '
+                'AND indexname NOT IN (SELECT conname FROM pg_constraint)', [tables])
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+        yield indexes
+
+        with connection.cursor() as cursor:
+            # Running the deferred foreign key checks now, tables with pending ones cannot be indexed
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            if maintenance_work_mem:
+                cursor.execute("SELECT set_config('maintenance_work_mem', %s, true)", [maintenance_work_mem])
+            for _, definition in indexes:
+                cursor.execute(definition)
+
+
+class Dumper:
+    """Append generated rows to one CSV file per table, loadable with --load"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.files = {}
+
+    def path(self, model):
+        return os.path.join(self.directory, f'{model._meta.db_table}.csv')
+
+    def write(self, model, columns, rows):
+        if model not in self.files:
+            self.files[model] = open(self.path(model), 'w', newline = '')
+            csv.writer(self.files[model]).writerow(columns)
+        csv.writer(self.files[model]).writerows(csv_rows(rows))
+        return len(rows)
+
+    def close(self):
+        for handle in self.files.values():
+            handle.close()
@@ -0,0 +1,71 @@
+"""
+    Worker and thread sizing for the production app server
+"""
+
+import os
+
+# Resident memory of one forked worker after preload, in MiB
+DEFAULT_WORKER_MEMORY_MB = 150
+# Memory left for the master process, page cache and the rest of the box
+RESERVED_MEMORY_MB = 256
+DEFAULT_THREADS = 4
+MAX_THREADS = 32
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus():
+    """CPUs this process may use, honouring affinity and cgroup quotas"""
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2, then v1
+    quota = _read('/sys/fs/cgroup/cpu.max')
+    if quota:
+        limit, _, period = quota.partition(' ')
+        if limit != 'max':
+            cpus = min(cpus, int(limit) / int(period))
+    else:
+        limit = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if limit and period and int(limit) > 0:
+            cpus = min(cpus, int(limit) / int(period))
+    return max(1, int(cpus))
+
+
+def available_memory():
+    """Bytes of memory this process may use, honouring cgroup limits"""
+
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        limit = _read(path)
+        if limit and limit.isdigit():
+            memory = min(memory, int(limit))
+            break
+    return memory
+
+
+def worker_count(cpus, memory, worker_memory_mb = DEFAULT_WORKER_MEMORY_MB):
+    """Gunicorn's 2 * CPUs + 1, capped by how many workers fit in memory"""
+
+    fits = (memory // 2 ** 20 - RESERVED_MEMORY_MB) // worker_memory_mb
+    return max(1, min(2 * cpus + 1, fits))
+
+
+def thread_count(cpus, workers, threads = DEFAULT_THREADS):
+    """Threads per worker; more when memory capped the worker count.
+
+    Requests mostly wait on the database, so threads cover the
+    concurrency that the missing workers would have provided.
+    """
+
+    return min(MAX_THREADS, max(threads, -(-threads * (2 * cpus + 1) // workers)))
@@ -0,0 +1,35 @@
+"""
+    Signal handlers keeping caches in sync with model writes and
+    instrumenting database connections
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core import instrumentation
+from core.authentication import invalidate_tokens
+
+
+@receiver(post_delete, sender = Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Forget a token as soon as it is deleted"""
+
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender = settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Forget the user's cached tokens so deactivation and password changes apply"""
+
+    if not created:
+        invalidate_tokens(Token.objects.filter(user = instance).values_list('key', flat = True))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Count the queries of sampled requests on every new connection"""
+
+    instrumentation.install(connection)
@@ -0,0 +1,23 @@
+"""
+    Test runner keeping the test database between runs
+"""
+
+import os
+
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner with --keepdb on by default.
+
+    Only new migrations are applied to a kept database; pass --no-keepdb
+    (or TEST_KEEPDB=0) after editing an existing migration. With
+    --parallel each process gets its own clone of the database.
+    """
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--no-keepdb', action='store_false', dest='keepdb',
+                            help='Create the test database from scratch and destroy it afterwards.')
+        parser.set_defaults(keepdb = os.environ.get('TEST_KEEPDB', '1') == '1')
@@ -0,0 +1,63 @@
+"""
+    Tests for the cached token authentication
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from core.authentication import CachedTokenAuthentication, token_cache
+from user.serializers import UserSerializer
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache().clear()
+        self.user = get_user_model().objects.create_user('auth@email.com', 'testpwd1234')
+        self.token = Token.objects.create(user = self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_repeated_authentication_is_cached(self):
+        """Test only the first lookup of a token hits the database"""
+
+        user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_deleted_token_is_invalidated(self):
+        """Test a deleted token stops authenticating immediately"""
+
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+        self.token.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_deactivated_user_is_invalidated(self):
+        """Test deactivating a user stops their cached token"""
+
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_password_change_invalidates_cache(self):
+        """Test changing the password through the serializer drops the entry"""
+
+        self.auth.authenticate_credentials(self.token.key)
+        serializer = UserSerializer(self.user, data = {'password': 'newpwd12345'}, partial = True)
+        serializer.is_valid(raise_exception = True)
+        serializer.save()
+
+        with self.assertNumQueries(1):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertTrue(user.check_password('newpwd12345'))
@@ -0,0 +1,44 @@
+"""
+    Tests for the persistent connection health checks
+"""
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+
+class ConnectionHealthCheckTests(TransactionTestCase):
+
+    def setUp(self):
+        self._health_checks = connection.settings_dict.get('CONN_HEALTH_CHECKS')
+
+    def tearDown(self):
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = self._health_checks
+        connection.close()
+
+    def _drop_connection(self):
+        """Close the socket under Django, as a restarted server or pooler would"""
+
+        connection.ensure_connection()
+        connection.connection.close()
+        # Request boundary: no Django error was seen, so the connection is kept
+        connection.close_if_unusable_or_obsolete()
+
+    def test_dropped_connection_is_replaced(self):
+        """Test a dead persistent connection is reopened before reuse"""
+
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = True
+        self._drop_connection()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_health_check_runs_once_per_request(self):
+        """Test only the first query of a request pays for the check"""
+
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = True
+        connection.ensure_connection()
+        connection.close_if_unusable_or_obsolete()
+
+        connection.ensure_connection()
+        self.assertTrue(connection.health_check_done)
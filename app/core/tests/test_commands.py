@@ -0,0 +1,315 @@
+"""
+    Tests for management commands
+"""
+
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from psycopg2 import OperationalError as psycopg2Error
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from core.management.commands.run_benchmark import compare
+from core.models import Recipe, RecipeStat, Tag
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """Truncating after each test drops the index pages that rolled back
+    benchmark inserts leave behind, which would skew test_indexes plans"""
+
+    def test_benchmark_tag_filter_leaves_no_data(self):
+        """Test the tag filter benchmark reports every case and rolls back"""
+
+        out = StringIO()
+        call_command('benchmark_tag_filter', recipes = 50, tags = 5,
+                     filter_tags = 2, repeat = 2, stdout = out)
+
+        self.assertIn('any: exists', out.getvalue())
+        self.assertIn('all: group by / having', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_benchmark_list_serializer_outputs_match(self):
+        """Test the list serializer benchmark finds both paths identical"""
+
+        out, err = StringIO(), StringIO()
+        call_command('benchmark_list_serializer', rows = [5, 20], tags = 4,
+                     repeat = 1, stdout = out, stderr = err)
+
+        self.assertIn('values rows: 20', out.getvalue())
+        self.assertEqual(err.getvalue(), '')
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BenchmarkSuiteCommandTests(TransactionTestCase):
+
+    def _seed(self, *args):
+        call_command('seed_benchmark', '--users', '2', '--recipes', '6', '--tags', '3',
+                     *args, stdout = StringIO())
+        return list(Recipe.objects.order_by('id').values_list('title', 'time_minutes', 'price'))
+
+    def test_seed_benchmark_is_deterministic(self):
+        """Test seeding twice with the same seed creates the same catalog"""
+
+        first = self._seed()
+        with self.assertRaises(CommandError):
+            self._seed()
+        second = self._seed('--replace')
+
+        self.assertEqual(first, second)
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 6)
+        user = get_user_model().objects.get(email = 'benchmark-0@example.com')
+        self.assertTrue(user.check_password('benchmark-pass'))
+        times = RecipeStat.objects.filter(user = user, dimension = RecipeStat.TIME)
+        self.assertEqual(sum(times.values_list('count', flat = True)), 6)
+
+    def test_run_benchmark_writes_results(self):
+        """Test the runner reports every selected endpoint and rolls back its writes"""
+
+        self._seed()
+        recipes = Recipe.objects.count()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('run_benchmark', '--only', 'recipe:recipe-list', 'user:me',
+                         '--requests', '2', '--warmup', '1', '--output', output, stdout = StringIO())
+            with open(output) as results:
+                report = json.load(results)
+
+            call_command('run_benchmark', '--only', 'user:me', '--requests', '2', '--warmup', '1',
+                         '--compare', output, '--threshold', '100000', stdout = StringIO())
+
+        endpoints = report['endpoints']
+        self.assertIn('recipe:recipe-list create', endpoints)
+        self.assertIn('user:me patch', endpoints)
+        self.assertEqual(endpoints['recipe:recipe-list create']['status'], 201)
+        self.assertGreater(endpoints['recipe:recipe-list create']['queries'], 0)
+        self.assertEqual(report['dataset']['recipes'], 6)
+        self.assertEqual(Recipe.objects.count(), recipes)
+
+    def test_compare_flags_regressions(self):
+        """Test slower p50 beyond threshold and extra queries are regressions"""
+
+        baseline = {'a': {'p50_ms': 10.0, 'queries': 2}, 'b': {'p50_ms': 1.0, 'queries': 2}}
+        current = {'a': {'p50_ms': 13.0, 'queries': 3}, 'b': {'p50_ms': 1.5, 'queries': 2},
+                   'c': {'p50_ms': 50.0, 'queries': 9}}
+
+        regressions = compare(baseline, current, threshold = 20, min_delta_ms = 1)
+
+        self.assertEqual(regressions, ['a: p50 10.00ms -> 13.00ms', 'a: queries 2 -> 3'])
+
+
+class BulkSeedCommandTests(TransactionTestCase):
+
+    def _indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename LIKE 'core_%%'")
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def _seed(self, *args):
+        call_command('bulk_seed', '--users', '3', '--recipes', '4', '--tags', '12',
+                     '--batch-size', '5', *args, stdout = StringIO())
+
+    def _assert_catalog(self):
+        self.assertEqual(get_user_model().objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 36)
+        self.assertEqual(Recipe.tags.through.objects.count(), 36)
+        user = get_user_model().objects.get(email = 'seed-1@example.com')
+        self.assertTrue(user.check_password('seed-pass'))
+        self.assertFalse(user.is_staff)
+
+        stored = list(Recipe.objects.order_by('id').values_list('tag_ids', 'tag_names'))
+        Recipe.objects.refresh_derived_fields()
+        self.assertEqual(stored, list(Recipe.objects.order_by('id').values_list('tag_ids', 'tag_names')))
+        self.assertFalse(Recipe.objects.filter(search_vector__isnull = True).exists())
+        times = RecipeStat.objects.filter(user = user, dimension = RecipeStat.TIME)
+        self.assertEqual(sum(times.values_list('count', flat = True)), 4)
+
+    def test_bulk_seed_generates_catalog(self):
+        """Test generated rows match what the ORM paths would maintain"""
+
+        indexes = self._indexes()
+        self._seed('--tokens')
+
+        self._assert_catalog()
+        self.assertEqual(Token.objects.count(), 3)
+        self.assertEqual(self._indexes(), indexes)
+        # Sequences were moved past the explicit ids
+        user = get_user_model().objects.get(email = 'seed-0@example.com')
+        Recipe.objects.create(user = user, title = 'After', time_minutes = 1, price = 1)
+
+    def test_bulk_seed_rejects_existing_prefix(self):
+        """Test seeding the same prefix twice is refused"""
+
+        self._seed('--no-defer-indexes')
+        with self.assertRaises(CommandError):
+            self._seed()
+
+    def test_bulk_seed_dump_and_load(self):
+        """Test dumped CSV files load into the same catalog"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            self._seed('--dump', directory)
+            self.assertFalse(Recipe.objects.exists())
+            self.assertTrue(os.path.exists(os.path.join(directory, 'core_recipe.csv')))
+
+            call_command('bulk_seed', '--load', directory, stdout = StringIO())
+
+        self._assert_catalog()
+
+
+class CheckRecipeTagsCommandTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('tags@email.com', 'testpwd1234')
+        self.recipe = Recipe.objects.create(user = user, title = 'Dal', time_minutes = 5, price = 2)
+        self.recipe.tags.add(Tag.objects.create(user = user, name = 'Vegan'))
+
+    def test_in_sync(self):
+        """Test a consistent catalog passes the check"""
+
+        out = StringIO()
+        call_command('check_recipe_tags', stdout = out)
+        self.assertIn('in sync', out.getvalue())
+
+    def test_drift_is_reported_and_repaired(self):
+        """Test stale arrays fail the check and --repair fixes them"""
+
+        Recipe.objects.filter(pk = self.recipe.pk).update(tag_ids = [], tag_names = ['Old'])
+
+        with self.assertRaises(CommandError):
+            call_command('check_recipe_tags', stdout = StringIO())
+
+        out = StringIO()
+        call_command('check_recipe_tags', '--repair', stdout = out)
+        self.assertIn(f'Out of sync: {self.recipe.pk}', out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_names, ['Vegan'])
+        call_command('check_recipe_tags', stdout = StringIO())
+
+
+class RebuildRecipeStatsCommandTests(TestCase):
+
+    def test_rebuild_restores_rollup(self):
+        """Test the rollup is recomputed from the recipes"""
+
+        user = get_user_model().objects.create_user('stats@email.com', 'testpwd1234')
+        Recipe.objects.create(user = user, title = 'Dal', time_minutes = 5, price = 2)
+        RecipeStat.objects.all().delete()
+
+        call_command('rebuild_recipe_stats', '--user', 'stats@email.com', stdout = StringIO())
+
+        self.assertEqual(
+            sorted(RecipeStat.objects.values_list('dimension', 'key', 'count')),
+            [(RecipeStat.PRICE, 0, 1), (RecipeStat.TIME, 5, 1)]
+        )
+        with self.assertRaises(CommandError):
+            call_command('rebuild_recipe_stats', '--user', 'nobody@email.com')
+
+
+@patch('core.management.commands.wait_for_db.time.sleep')
+@patch('core.management.commands.wait_for_db.Command._ping')
+@patch('core.management.commands.wait_for_db.Command.check')
+class WaitForDbCommandTests(SimpleTestCase):
+
+    def test_wait_for_db_ready(self, patched_check, patched_ping, patched_sleep):
+        """Test the command returns at once when the database is up"""
+
+        call_command('wait_for_db', stdout = StringIO())
+
+        patched_check.assert_called_once_with(databases = list(connections))
+        patched_ping.assert_called_once_with(list(connections))
+        patched_sleep.assert_not_called()
+
+    def test_wait_for_db_backs_off(self, patched_check, patched_ping, patched_sleep):
+        """Test retries wait with an exponentially growing, capped delay"""
+
+        patched_check.side_effect = [psycopg2Error] * 2 + [OperationalError] * 3 + [True]
+
+        call_command('wait_for_db', backoff = 1, max_backoff = 4, stdout = StringIO())
+
+        self.assertEqual(patched_check.call_count, 6)
+        self.assertEqual([c.args[0] for c in patched_sleep.call_args_list], [1, 2, 4, 4, 4])
+
+    def test_wait_for_db_max_attempts(self, patched_check, patched_ping, patched_sleep):
+        """Test the command gives up after the allowed attempts"""
+
+        patched_check.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', max_attempts = 3, stdout = StringIO())
+        self.assertEqual(patched_check.call_count, 3)
+
+    def test_wait_for_db_timeout(self, patched_check, patched_ping, patched_sleep):
+        """Test the command gives up once the next wait would pass the timeout"""
+
+        patched_check.side_effect = OperationalError
+        clock = [0]
+        patched_sleep.side_effect = lambda seconds: clock.append(clock.pop() + seconds)
+
+        with patch('core.management.commands.wait_for_db.time.monotonic', lambda: clock[0]):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout = 3, backoff = 1, stdout = StringIO())
+        self.assertEqual([c.args[0] for c in patched_sleep.call_args_list], [1, 2])
+
+
+@patch('core.management.commands.serve.available_cpus', return_value = 4)
+class ServeCommandTests(SimpleTestCase):
+
+    def resolve(self, *args):
+        out = StringIO()
+        call_command('serve', '--print-config', *args, stdout = out)
+        return dict(line.split(' = ', 1) for line in out.getvalue().splitlines())
+
+    @patch('core.management.commands.serve.available_memory', return_value = 8 * 2 ** 30)
+    def test_serve_sizes_workers_from_cpus(self, patched_memory, patched_cpus):
+        """Test workers follow 2 * CPUs + 1 when memory allows"""
+
+        config = self.resolve()
+
+        self.assertEqual(config['workers'], '9')
+        self.assertEqual(config['threads'], '4')
+        self.assertEqual(config['preload_app'], 'True')
+
+    @patch('core.management.commands.serve.available_memory', return_value = 512 * 2 ** 20)
+    def test_serve_caps_workers_by_memory(self, patched_memory, patched_cpus):
+        """Test a small memory limit trades workers for threads"""
+
+        config = self.resolve()
+
+        self.assertEqual(config['workers'], '1')
+        self.assertEqual(config['threads'], '32')
+
+    def test_serve_explicit_options(self, patched_cpus):
+        """Test explicit sizes win and ASGI uses one uvicorn worker per CPU"""
+
+        config = self.resolve('--workers', '2', '--threads', '8', '--no-preload')
+        self.assertEqual((config['workers'], config['threads']), ('2', '8'))
+        self.assertEqual(config['preload_app'], 'False')
+
+        config = self.resolve('--asgi')
+        self.assertEqual(config['workers'], '4')
+        self.assertEqual(config['worker_class'], "'uvicorn.workers.UvicornWorker'")
+
+    @patch('core.management.commands.serve.Server')
+    def test_serve_refuses_local_cache_with_several_workers(self, patched_server, patched_cpus):
+        """Test several workers need a shared cache, a single one does not"""
+
+        with self.assertRaisesMessage(CommandError, 'core.E002: RESPONSE_CACHE'):
+            call_command('serve', '--workers', '2')
+        patched_server.assert_not_called()
+
+        call_command('serve', '--workers', '1')
+        patched_server.return_value.run.assert_called_once_with()
+
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+                              'LOCATION': 'memcached:11211'}}
+        with override_settings(CACHES = shared):
+            call_command('serve', '--workers', '2')
+        self.assertEqual(patched_server.return_value.run.call_count, 2)
@@ -0,0 +1,62 @@
+"""
+    Tests checking the hot queries are planned on their indexes
+"""
+
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Recipe, Tag
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are Postgres specific')
+class QueryPlanTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('plans@email.com', 'testpwd1234')
+        self.tag = Tag.objects.create(user = self.user, name = 'Dinner')
+
+        # Tiny test tables are always cheaper to scan sequentially and to sort,
+        # whatever statistics a kept test database carries over from earlier runs
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_recipe_list_uses_user_id_index(self):
+        """Test the per-user recipe list is read from the composite index"""
+
+        queryset = Recipe.objects.filter(user = self.user).order_by('-id')[:50]
+        self.assertUsesIndex(queryset, 'recipe_user_id_desc_idx')
+
+    def test_tag_list_uses_user_name_index(self):
+        """Test the per-user tag list is read in name order from the index"""
+
+        queryset = Tag.objects.filter(user = self.user).order_by('-name')
+        self.assertUsesIndex(queryset, 'unique_tag_name_per_user')
+
+    def test_tag_filter_uses_reverse_through_index(self):
+        """Test looking up recipes by tag uses the (tag, recipe) index"""
+
+        queryset = (Recipe.tags.through.objects
+                    .filter(tag_id__in = [self.tag.id])
+                    .values('recipe_id'))
+        self.assertUsesIndex(queryset, 'recipe_tags_tag_recipe_idx')
+
+    def test_tag_array_filter_uses_gin_index(self):
+        """Test any/all tag filters on the tag_ids array read its GIN index"""
+
+        for match_all in (False, True):
+            queryset = Recipe.objects.with_tags([self.tag.id], match_all, use_arrays = True)
+            self.assertUsesIndex(queryset, 'recipe_tag_ids_idx')
+
+    def test_search_uses_gin_index(self):
+        """Test full-text search reads the GIN index on the stored vector"""
+
+        queryset = Recipe.objects.search('curry')
+        self.assertUsesIndex(queryset, 'recipe_search_vector_idx')
@@ -0,0 +1,217 @@
+"""
+    Tests for request instrumentation and the metrics endpoint
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import instrumentation
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+
+
+def _server_timing(response):
+    """Parse Server-Timing into {name: {'dur': ..., 'desc': ...}}"""
+
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE = 1.0)
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        caches[settings.INSTRUMENTATION_CACHE].clear()
+        caches[settings.RESPONSE_CACHE].clear()
+        # A fresh registry, its slot numbers must match the cleared cache
+        patcher = patch.object(instrumentation, 'registry', instrumentation.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user('user@example.com', 'pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index in range(3):
+            Recipe.objects.create(user = self.user, title = f'Recipe {index}', time_minutes = 5, price = 1)
+
+    def test_server_timing_header(self):
+        """Sampled responses report queries, phases and size"""
+
+        res = self.client.get(RECIPES_URL)
+
+        timing = _server_timing(res)
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'total'})
+        self.assertGreaterEqual(int(timing['db']['desc'].strip('"').split()[0]), 1)
+        self.assertEqual(timing['total']['desc'], f'"{len(res.content)} bytes"')
+        self.assertGreater(float(timing['total']['dur']), 0)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE = 0.0)
+    def test_unsampled_request(self):
+        """Requests outside the sample are neither timed nor recorded"""
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertEqual(instrumentation.registry.series, {})
+
+    @override_settings(INSTRUMENTATION_SERVER_TIMING = False)
+    def test_server_timing_disabled(self):
+        """The header can be turned off while metrics are still recorded"""
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertEqual(instrumentation.registry.series['recipe:recipe-list', 'GET']['count'], 1)
+
+    @override_settings(INSTRUMENTATION_METRICS_TOKEN = 'secret')
+    def test_metrics_endpoint(self):
+        """Per-route histograms are exposed in the Prometheus text format"""
+
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION = 'Bearer secret')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = res.content.decode()
+        labels = 'route="recipe:recipe-list",method="GET"'
+        self.assertIn(f'app_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'app_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'app_request_queries_count{{{labels}}} 2', body)
+        self.assertIn(f'app_response_bytes_total{{{labels}}}', body)
+
+    def _other_worker(self):
+        """A second registry publishing the same series, as another worker would"""
+
+        other = instrumentation.Registry()
+        other.series = instrumentation._copy(instrumentation.registry.series)
+        other.flush(force = True)
+        return other
+
+    def test_metrics_sum_worker_snapshots(self):
+        """Snapshots published by other workers are added to this one's"""
+
+        self.client.get(RECIPES_URL)
+        instrumentation.registry.flush(force = True)
+        self._other_worker()
+
+        series = instrumentation.registry.collect()
+
+        self.assertEqual(series['recipe:recipe-list', 'GET']['count'], 2)
+        self.assertEqual(sum(series['recipe:recipe-list', 'GET']['duration_buckets']), 2)
+
+    def test_expired_workers_are_folded(self):
+        """A recycled worker's counts stay in the totals after its heartbeat expires"""
+
+        self.client.get(RECIPES_URL)
+        instrumentation.registry.flush(force = True)
+        other = self._other_worker()
+        cache = caches[settings.INSTRUMENTATION_CACHE]
+        cache.delete(other._alive_key(other.slot))
+
+        for _ in range(2):
+            series = instrumentation.registry.collect()
+            self.assertEqual(series['recipe:recipe-list', 'GET']['count'], 2)
+        self.assertIsNone(cache.get(other._snapshot_key(other.slot)))
+
+    def test_new_slot_publishes_only_new_requests(self):
+        """A process moving to a new slot does not publish its old counts twice"""
+
+        registry = instrumentation.registry
+        self.client.get(RECIPES_URL)
+        registry.flush(force = True)
+        first = registry.slot
+
+        # As after a fork
+        registry._pid = None
+        self.client.get(RECIPES_URL)
+        registry.flush(force = True)
+
+        self.assertNotEqual(registry.slot, first)
+        self.assertEqual(registry.collect()['recipe:recipe-list', 'GET']['count'], 2)
+
+    def test_concurrent_flushes_claim_one_slot(self):
+        """Threads flushing together after a fork share one new slot"""
+
+        registry = instrumentation.registry
+        self.client.get(RECIPES_URL)
+        cache = caches[settings.INSTRUMENTATION_CACHE]
+        incr = type(cache).incr
+
+        def slow_incr(*args, **kwargs):
+            # Widens the window between reading and claiming the slot
+            time.sleep(0.05)
+            return incr(*args, **kwargs)
+
+        with patch.object(type(cache), 'incr', slow_incr):
+            threads = [threading.Thread(target = registry.flush, kwargs = {'force': True}) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(cache.get(registry.COUNT_KEY), 1)
+        self.assertEqual(registry.collect()['recipe:recipe-list', 'GET']['count'], 1)
+
+    def test_async_flush_is_kept_off_the_event_loop(self):
+        """The async middleware publishes snapshots outside the event loop"""
+
+        on_loop = []
+
+        def record(force = False):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                on_loop.append(False)
+            else:
+                on_loop.append(True)
+
+        async def view(request):
+            return HttpResponse('ok')
+
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        with patch.object(instrumentation.registry, 'due', return_value = True), \
+                patch.object(instrumentation.registry, 'flush', side_effect = record):
+            async_to_sync(middleware.__acall__)(RequestFactory().get(RECIPES_URL))
+
+        self.assertEqual(on_loop, [False])
+
+    @override_settings(INSTRUMENTATION_METRICS_TOKEN = 'secret')
+    def test_metrics_token(self):
+        """A configured token is required to scrape"""
+
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION = 'Bearer secret')
+        self.assertEqual(res.status_code, 200)
+
+    def test_metrics_closed_without_token(self):
+        """Without a configured token nobody can scrape"""
+
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        self.assertEqual(self.client.get(METRICS_URL, HTTP_AUTHORIZATION = 'Bearer ').status_code, 403)
+
+    def test_timed_excludes_queries(self):
+        """Queries inside a timed block count as database time only"""
+
+        with instrumentation.measuring() as metrics, instrumentation.timed('serialize'):
+            list(Recipe.objects.all())
+
+        self.assertEqual(metrics.queries, 1)
+        self.assertGreater(metrics.db, 0)
+        self.assertGreaterEqual(metrics.serialize, 0)
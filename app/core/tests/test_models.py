@@ -2,11 +2,12 @@
     Tests for models
 """
 
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
 
-from core.models import Recipe
+from core.models import Recipe, Tag
 class ModelTests(TestCase):
 
     def test_user_created_by_email_successful(self):
@@ -65,4 +66,28 @@ class ModelTests(TestCase):
             description = 'test recipe description'
         )
 
-        self.assertEqual(str(recipe), recipe.title)
\ No newline at end of file
+        self.assertEqual(str(recipe), recipe.title)
+
+    def test_tag_name_unique_per_user(self):
+        """Test a user cannot own two tags with the same name"""
+
+        user = get_user_model().objects.create_user('tags@email.com', 'testpwd1234')
+        other = get_user_model().objects.create_user('other@email.com', 'testpwd1234')
+        Tag.objects.create(user = user, name = 'Vegan')
+        Tag.objects.create(user = other, name = 'Vegan')
+
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(user = user, name = 'Vegan')
+
+    def test_tag_get_or_create_many(self):
+        """Test bulk tag resolution reuses existing tags and creates the rest"""
+
+        user = get_user_model().objects.create_user('tags@email.com', 'testpwd1234')
+        existing = Tag.objects.create(user = user, name = 'Vegan')
+
+        tags = Tag.objects.get_or_create_many(user, ['Vegan', 'Quick', 'Quick'])
+
+        self.assertEqual(set(tags), {'Vegan', 'Quick'})
+        self.assertEqual(tags['Vegan'], existing)
+        self.assertIsNotNone(tags['Quick'].id)
+        self.assertEqual(Tag.objects.filter(user = user).count(), 2)
@@ -0,0 +1,36 @@
+"""
+    Tests for the orjson backed renderer
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def test_matches_drf_renderer(self):
+        """Test the output is byte-identical to DRF's JSONRenderer"""
+
+        data = {
+            'results': [{'id': 1, 'price': Decimal('5.05'), 'title': 'Dal   makhani é'}],
+            'when': datetime(2024, 1, 2, 3, 4, 5, tzinfo = timezone.utc),
+            'detail': gettext_lazy('Not found.'),
+            'next': None,
+        }
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indented_output_falls_back(self):
+        """Test indentation requests are rendered by the stock renderer"""
+
+        data = {'id': 1}
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(FastJSONRenderer().render(data, media_type),
+                         JSONRenderer().render(data, media_type))
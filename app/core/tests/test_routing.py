@@ -0,0 +1,187 @@
+"""
+    Tests for read replica routing
+"""
+
+import asyncio
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.routing import ReplicaRoutingMiddleware
+
+REPLICAS = ['replica_0', 'replica_1']
+
+
+@override_settings(DATABASE_REPLICAS = REPLICAS)
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(self._route)
+
+    def _route(self, request):
+        """Stand-in view recording where a recipe read would be sent"""
+
+        self.read_db = router.db_for_read(Recipe)
+        self.token_db = router.db_for_read(Token)
+        return HttpResponse()
+
+    def _request(self, method, token = 'abc'):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        self.middleware(getattr(self.factory, method)('/api/recipe/recipes/', **headers))
+        return self.read_db
+
+    def test_safe_requests_read_from_replicas(self):
+        """Test GET and HEAD reads go to one of the replicas"""
+
+        self.assertIn(self._request('get'), REPLICAS)
+        self.assertIn(self._request('head', token = None), REPLICAS)
+
+    def test_unsafe_requests_read_from_primary(self):
+        """Test reads during writes stay on the primary"""
+
+        self.assertEqual(self._request('post'), 'default')
+        self.assertEqual(self._request('patch'), 'default')
+
+    def test_client_reads_its_writes(self):
+        """Test a client is pinned to the primary after writing"""
+
+        self._request('post', token = 'writer')
+
+        self.assertEqual(self._request('get', token = 'writer'), 'default')
+        self.assertIn(self._request('get', token = 'reader'), REPLICAS)
+
+    def test_pin_expires(self):
+        """Test the pin only lasts for the configured window"""
+
+        with self.settings(REPLICA_PIN_SECONDS = 0):
+            self._request('post', token = 'writer')
+
+        self.assertIn(self._request('get', token = 'writer'), REPLICAS)
+
+    def test_tokens_read_from_primary(self):
+        """Test token lookups never hit a lagging replica"""
+
+        self._request('get')
+        self.assertEqual(self.token_db, 'default')
+
+    def test_async_pins_are_kept_off_the_event_loop(self):
+        """Test the async middleware reads and writes pins outside the event loop"""
+
+        on_loop = []
+
+        def record(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                on_loop.append(False)
+            else:
+                on_loop.append(True)
+
+        async def view(request):
+            return self._route(request)
+
+        middleware = ReplicaRoutingMiddleware(view)
+        cache_class = type(caches[settings.REPLICA_PIN_CACHE])
+        with patch.object(cache_class, 'get', side_effect = record), \
+                patch.object(cache_class, 'set', side_effect = record):
+            for method in ('post', 'get'):
+                request = getattr(self.factory, method)('/api/recipe/recipes/', HTTP_AUTHORIZATION = 'Token abc')
+                async_to_sync(middleware.__acall__)(request)
+
+        self.assertEqual(on_loop, [False, False])
+        self.assertIn(self.read_db, REPLICAS)
+
+    def test_pin_cache_unused_without_replicas(self):
+        """Test requests skip the pin cache when no replicas are configured"""
+
+        cache_class = type(caches[settings.REPLICA_PIN_CACHE])
+        with self.settings(DATABASE_REPLICAS = []), \
+                patch.object(cache_class, 'get') as get, patch.object(cache_class, 'set') as set_:
+            self.assertEqual(self._request('post'), 'default')
+            self.assertEqual(self._request('get'), 'default')
+
+        get.assert_not_called()
+        set_.assert_not_called()
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test management commands and shells keep using the primary"""
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        """Test migrations only run against the primary"""
+
+        self.assertFalse(router.allow_migrate('replica_0', 'core'))
+        self.assertTrue(router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS = REPLICAS)
+class ReplicaIntegrationTests(TransactionTestCase):
+    """Test requests against the replica_* test mirrors of the test database"""
+
+    # Mirrors are separate connections, they only see committed rows
+    databases = '__all__'
+
+    def setUp(self):
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        user = get_user_model().objects.create_user('replica@email.com', 'testpwd1234')
+        token = Token.objects.create(user = user)
+        self.recipe = Recipe.objects.create(user = user, title = 'Dal', time_minutes = 20, price = 4)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = f'Token {token.key}')
+
+    def _capture(self, request):
+        with ExitStack() as stack:
+            contexts = {alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in ['default', *REPLICAS]}
+            res = request()
+        return res, {alias: [query['sql'] for query in context.captured_queries]
+                     for alias, context in contexts.items()}
+
+    def test_recipe_detail_reads_from_replica(self):
+        """Test a recipe detail queries a replica connection, tokens stay on the primary"""
+
+        url = reverse('recipe:recipe-detail', args = [self.recipe.id])
+        res, queries = self._capture(lambda: self.client.get(url))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['title'], 'Dal')
+        self.assertTrue(any(queries[alias] for alias in REPLICAS))
+        self.assertFalse(any('core_recipe' in sql for sql in queries['default']))
+        self.assertTrue(any('authtoken_token' in sql for sql in queries['default']))
+
+    def test_cached_list_misses_read_from_primary(self):
+        """Test a list page stored in the response cache never comes from a replica"""
+
+        res, queries = self._capture(lambda: self.client.get(reverse('recipe:recipe-list')))
+
+        self.assertEqual([recipe['title'] for recipe in res.json()['results']], ['Dal'])
+        self.assertFalse(any(queries[alias] for alias in REPLICAS))
+        self.assertTrue(any('core_recipe' in sql for sql in queries['default']))
+
+    def test_client_reads_its_writes_from_primary(self):
+        """Test a read right after a write is sent to the primary"""
+
+        payload = {'title': 'Soup', 'time_minutes': 10, 'price': '2.00', 'tags': []}
+        res = self.client.post(reverse('recipe:recipe-list'), payload, format = 'json')
+        self.assertEqual(res.status_code, 201)
+
+        url = reverse('recipe:recipe-detail', args = [res.json()['id']])
+        res, queries = self._capture(lambda: self.client.get(url))
+
+        self.assertEqual(res.json()['title'], 'Soup')
+        self.assertFalse(any(queries[alias] for alias in REPLICAS))
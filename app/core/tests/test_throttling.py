@@ -0,0 +1,139 @@
+"""
+    Tests for the scoped sliding window throttle
+"""
+
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import ScopedSlidingWindowThrottle
+
+RECIPE_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+TAG_URL = reverse('recipe:tag-list')
+CREATE_USER_URL = reverse('user:create')
+
+
+def throttle_rates(**rates):
+    """REST_FRAMEWORK settings with the given scope rates"""
+
+    return {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+    }
+
+
+class ScopedSlidingWindowThrottleTests(TestCase):
+
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        self.user = get_user_model().objects.create_user('throttle@example.com', 'pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Start of a one minute window
+        self.clock = patch.object(ScopedSlidingWindowThrottle, 'timer', return_value = 6000.0)
+        self.timer = self.clock.start()
+        self.addCleanup(self.clock.stop)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(read = '3/min'))
+    def test_read_scope_refuses_over_rate(self):
+        """Test reads over the rate get 429 with Retry-After, writes do not count"""
+
+        for _ in range(3):
+            self.assertEqual(self.client.get(TAG_URL).status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '80')
+        payload = {'title': 'Dal', 'time_minutes': 20, 'price': '4.00', 'tags': []}
+        res = self.client.post(RECIPE_URL, payload, format = 'json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(read = '3/min'))
+    def test_previous_window_is_weighted(self):
+        """Test the previous window counts for the part still in the sliding window"""
+
+        for _ in range(3):
+            self.client.get(TAG_URL)
+
+        # Half way through the next window, the previous three count as 1.5
+        self.timer.return_value = 6090.0
+        self.assertEqual(self.client.get(TAG_URL).status_code, status.HTTP_200_OK)
+        res = self.client.get(TAG_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '10')
+
+        self.timer.return_value = 6100.0
+        self.assertEqual(self.client.get(TAG_URL).status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(read = '2/min'))
+    def test_refused_requests_are_not_counted(self):
+        """Test retrying while throttled does not push the limit further out"""
+
+        for _ in range(5):
+            self.client.get(TAG_URL)
+
+        self.timer.return_value = 6060.0
+        self.assertEqual(self.client.get(TAG_URL).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.timer.return_value = 6090.0
+        self.assertEqual(self.client.get(TAG_URL).status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(read = '2/min'))
+    def test_users_are_throttled_separately(self):
+        """Test one user's requests do not use another's quota"""
+
+        for _ in range(3):
+            self.client.get(TAG_URL)
+
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user('other@example.com', 'pass12345'))
+        self.assertEqual(other.get(TAG_URL).status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(read = '5/min', bulk = '1/min'))
+    def test_bulk_actions_use_bulk_scope(self):
+        """Test exports are limited by the bulk rate, not the read rate"""
+
+        self.assertEqual(self.client.get(EXPORT_URL).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(EXPORT_URL).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(RECIPE_URL).status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(auth = '2/min'))
+    def test_auth_scope_limits_anonymous_clients_per_ip(self):
+        """Test signups are limited per client IP"""
+
+        client = APIClient()
+        for index in range(2):
+            payload = {'email': f'new{index}@example.com', 'password': 'pass12345', 'name': 'New'}
+            res = client.post(CREATE_USER_URL, payload, REMOTE_ADDR = '10.0.0.1')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        payload = {'email': 'new2@example.com', 'password': 'pass12345', 'name': 'New'}
+        res = client.post(CREATE_USER_URL, payload, REMOTE_ADDR = '10.0.0.1')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        res = client.post(CREATE_USER_URL, payload, REMOTE_ADDR = '10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(REST_FRAMEWORK = throttle_rates(auth = '1/min'))
+    def test_token_view_is_throttled(self):
+        """Test the login view uses the auth scope despite ObtainAuthToken"""
+
+        client = APIClient()
+        payload = {'email': 'throttle@example.com', 'password': 'pass12345'}
+        self.assertEqual(client.post(reverse('user:token'), payload).status_code, status.HTTP_200_OK)
+        self.assertEqual(client.post(reverse('user:token'), payload).status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_scope_without_rate_is_not_throttled(self):
+        """Test the test settings leave every scope unthrottled"""
+
+        for _ in range(5):
+            self.assertEqual(self.client.get(TAG_URL).status_code, status.HTTP_200_OK)
+        self.assertFalse(caches[settings.THROTTLE_CACHE].get(f'throttle:read:{self.user.pk}:100'))
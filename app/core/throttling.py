@@ -0,0 +1,104 @@
+"""
+    Scoped API throttling with sliding window counters
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ScopedSlidingWindowThrottle(SimpleRateThrottle):
+    """Throttle each user, or client IP when anonymous, per scope.
+
+    A view picks its scope with ``throttle_scope``; without one, actions
+    listed in the view's ``bulk_actions`` are ``bulk``, safe methods are
+    ``read`` and everything else is ``write``. Rates come from
+    DEFAULT_THROTTLE_RATES, a scope without a rate is not throttled.
+
+    Requests are counted in fixed windows of the rate's period in
+    THROTTLE_CACHE. The previous window's count, weighted by how much of it
+    still overlaps the sliding window, is added to the current one. That is
+    three cache calls per request whatever the rate, where DRF's throttles
+    keep and rewrite a list of every request timestamp. The count is taken
+    with incr(), so concurrent requests never both get the last slot on
+    backends where incr() is atomic (local memory, memcached, Redis).
+    """
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def __init__(self):
+        # The scope depends on the request, the rate is looked up in allow_request()
+        pass
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        if getattr(view, 'action', None) in getattr(view, 'bulk_actions', ()):
+            return 'bulk'
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def get_rate(self):
+        # Read per request so override_settings and setting changes apply
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(request, view)
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        cache = caches[settings.THROTTLE_CACHE]
+        key = self.get_cache_key(request, view)
+        window, self.elapsed = divmod(self.timer(), self.duration)
+        current, previous = f'{key}:{int(window)}', f'{key}:{int(window) - 1}'
+
+        # Kept for two periods, the next window still weighs this one
+        cache.add(current, 0, self.duration * 2)
+        try:
+            self.count = cache.incr(current)
+        except ValueError:
+            # Expired between the two calls
+            cache.add(current, 1, self.duration * 2)
+            self.count = 1
+        self.previous = cache.get(previous, 0)
+
+        overlap = 1 - self.elapsed / self.duration
+        if self.previous * overlap + self.count <= self.num_requests:
+            return True
+
+        # Refused requests do not count, a client retrying too early is not locked out longer
+        try:
+            cache.decr(current)
+        except ValueError:
+            pass
+        return False
+
+    def wait(self):
+        """Seconds until the refused request would be allowed"""
+
+        # Rounded so float noise does not add a second to Retry-After
+        return round(self._wait(), 3)
+
+    def _wait(self):
+        spare = self.num_requests - self.count
+        if spare >= 0 and self.previous:
+            # Allowed once enough of the previous window slides out
+            return self.duration * (1 - spare / self.previous) - self.elapsed
+
+        # Allowed in the next window, once enough of this one slides out
+        remaining = self.duration - self.elapsed
+        stored = self.count - 1
+        if not stored or self.num_requests - 1 >= stored:
+            return remaining
+        return remaining + self.duration * (1 - (self.num_requests - 1) / stored)
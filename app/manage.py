@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    # The test suite runs with cheap password hashing and a kept database
+    testing = len(sys.argv) > 1 and sys.argv[1] == 'test'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.test_settings' if testing else 'app.settings')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -0,0 +1,93 @@
+"""
+    Per-user versioned caching of recipe and tag list responses
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.routing import primary_reads
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE]
+
+
+def _version_key(user_id):
+    return f'catalog-version:{user_id}'
+
+
+def get_catalog_version(user_id):
+    """Return the user's catalog version, starting one if missing"""
+
+    # Seeding from the clock so an evicted counter never reuses an old version
+    return _cache().get_or_set(_version_key(user_id), time.time_ns, timeout = None)
+
+
+def _bump(user_id):
+    try:
+        _cache().incr(_version_key(user_id))
+    except ValueError:
+        _cache().set(_version_key(user_id), time.time_ns(), timeout = None)
+
+
+def bump_catalog_version(user_id):
+    """Invalidate every cached list response of the user.
+
+    The version is bumped right away and again once the surrounding
+    transaction commits, so a response cached from a read that raced the
+    uncommitted write cannot outlive it.
+    """
+
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+class CatalogCacheMixin:
+    """Cache list responses per user, query and catalog version.
+
+    Responses carry a strong ETag derived from the same key, so a matching
+    If-None-Match is answered with 304 before anything is serialized. Misses
+    are read from the primary, replicas serve the other reads.
+    """
+
+    def list(self, request, *args, **kwargs):
+        etag, response = self.cached_list(request)
+        if response is None:
+            # Stored under the newest version until the next write, so it must
+            # not be read from a replica that has not caught up with that write
+            with primary_reads():
+                response = super().list(request, *args, **kwargs)
+            _cache().set(etag, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            response['ETag'] = etag
+        return response
+
+    def cached_list(self, request):
+        """Return the list ETag and a 304 or cached response, or None on a miss
+
+        Only the cache is consulted, never the database.
+        """
+
+        etag = quote_etag(self._catalog_cache_key(request))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return etag, Response(status = status.HTTP_304_NOT_MODIFIED, headers = {'ETag': etag})
+
+        data = _cache().get(etag)
+        if data is None:
+            return etag, None
+        return etag, Response(data, headers = {'ETag': etag})
+
+    def _catalog_cache_key(self, request):
+        version = get_catalog_version(request.user.id)
+        query = sorted(request.query_params.lists())
+        raw = (
+            f'{self.basename}:{request.user.id}:{version}:'
+            f'{request.accepted_renderer.format}:{request.get_host()}:{query}'
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
@@ -0,0 +1,106 @@
+"""
+    Bulk recipe import from NDJSON streams
+"""
+
+import json
+
+from django.db import transaction
+
+from core.models import Recipe, Tag
+from recipe.caching import bump_catalog_version
+from recipe.serializers import RecipeSerializers
+from recipe.stats import apply_deltas, recipe_deltas, tag_deltas
+
+
+class RecipeImporter:
+    """Validate NDJSON recipe lines and insert the valid ones in chunks.
+
+    Lines are consumed lazily and at most ``chunk_size`` validated recipes
+    are held at a time, so memory stays flat regardless of upload size.
+    Invalid lines are reported with their line number and skipped.
+    """
+
+    def __init__(self, user, context, chunk_size, max_errors):
+        self.user = user
+        self.context = context
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self._chunk = []
+
+    def run(self, lines):
+        """Import every line and return the summary"""
+
+        for line_no, line in enumerate(lines, start = 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            validated = self._validate(line_no, line)
+            if validated is None:
+                continue
+
+            self._chunk.append(validated)
+            if len(self._chunk) >= self.chunk_size:
+                self._flush()
+
+        self._flush()
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def _validate(self, line_no, line):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            self._add_error(line_no, {'non_field_errors': ['Invalid JSON.']})
+            return None
+
+        serializer = RecipeSerializers(data = data, context = self.context)
+        if not serializer.is_valid():
+            self._add_error(line_no, serializer.errors)
+            return None
+        return serializer.validated_data
+
+    def _add_error(self, line_no, errors):
+        self.failed += 1
+        # Keeping only the first errors so a bad upload cannot grow the response
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_no, 'errors': errors})
+
+    def _flush(self):
+        """Insert the pending recipes, their tags and tag links"""
+
+        if not self._chunk:
+            return
+
+        chunk, self._chunk = self._chunk, []
+        tag_names = [[tag['name'] for tag in data.pop('tags', [])] for data in chunk]
+
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                [Recipe(user = self.user, **data) for data in chunk]
+            )
+            tag_map = Tag.objects.get_or_create_many(
+                self.user, (name for names in tag_names for name in names))
+
+            Through = Recipe.tags.through
+            links = Through.objects.bulk_create([
+                Through(recipe_id = recipe.id, tag_id = tag_map[name].id)
+                for recipe, names in zip(recipes, tag_names)
+                for name in set(names)
+            ])
+            Recipe.objects.filter(pk__in = [recipe.id for recipe in recipes]).refresh_derived_fields()
+
+            # bulk_create sends no signals
+            deltas = tag_deltas(link.tag_id for link in links)
+            for recipe in recipes:
+                deltas += recipe_deltas(recipe.time_minutes, recipe.price)
+            apply_deltas(self.user.id, deltas)
+
+        bump_catalog_version(self.user.id)
+        self.created += len(recipes)
@@ -0,0 +1,32 @@
+"""
+    Pagination classes for the recipe APIs
+"""
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over recipe ids, newest first.
+
+    The cursor is an opaque encoding of the last seen id, so every page is
+    fetched with ``WHERE id < cursor ORDER BY id DESC LIMIT n`` and deep
+    pages cost the same as the first one.
+    """
+
+    ordering = '-id'
+    page_size = settings.RECIPE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.RECIPE_MAX_PAGE_SIZE
+
+
+class RecipeSearchPagination(PageNumberPagination):
+    """Page numbers for ranked search results.
+
+    Ranks are not unique, so they cannot serve as a cursor. Search result
+    sets are narrow and rarely paged deeply, which keeps OFFSET cheap.
+    """
+
+    page_size = settings.RECIPE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.RECIPE_MAX_PAGE_SIZE
@@ -0,0 +1,159 @@
+"""
+    Signal handlers invalidating cached recipe and tag responses and
+    maintaining the recipe statistics rollup
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Recipe, RecipeStat, Tag
+from recipe.caching import bump_catalog_version
+from recipe.stats import apply_deltas, recipe_deltas, tag_deltas
+
+
+def _touch_recipes(recipes):
+    """Move updated_at forward and reindex recipes whose tags changed"""
+
+    recipes.refresh_derived_fields(updated_at = timezone.now())
+
+
+@receiver(post_save, sender = Recipe)
+@receiver(post_delete, sender = Recipe)
+@receiver(post_save, sender = Tag)
+@receiver(post_delete, sender = Tag)
+def invalidate_catalog(sender, instance, **kwargs):
+    """Bump the owner's catalog version on recipe and tag writes"""
+
+    bump_catalog_version(instance.user_id)
+
+
+@receiver(post_save, sender = Tag)
+def touch_renamed_tag_recipes(sender, instance, created, **kwargs):
+    """Recipes embed their tag names, so a rename changes them too"""
+
+    if not created:
+        _touch_recipes(Recipe.objects.filter(tags = instance))
+
+
+@receiver(post_save, sender = Recipe)
+def index_saved_recipe(sender, instance, created, update_fields = None, **kwargs):
+    """Keep the stored search vector in line with the recipe text"""
+
+    # Creators refresh every derived field once the tags are linked
+    if created:
+        return
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    Recipe.objects.filter(pk = instance.pk).refresh_search_vectors()
+
+
+@receiver(pre_delete, sender = Tag)
+def collect_deleted_tag_recipes(sender, instance, **kwargs):
+    """Remember the tag's recipes, the links are gone after the delete"""
+
+    instance._recipe_ids = list(
+        Recipe.objects.filter(tags = instance).values_list('id', flat = True))
+
+
+@receiver(post_delete, sender = Tag)
+def touch_deleted_tag_recipes(sender, instance, **kwargs):
+    """Recipes lose the tag when it is deleted"""
+
+    recipe_ids = getattr(instance, '_recipe_ids', None)
+    if recipe_ids:
+        _touch_recipes(Recipe.objects.filter(pk__in = recipe_ids))
+
+
+@receiver(m2m_changed, sender = Recipe.tags.through)
+def invalidate_catalog_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump the owner's catalog version when recipe tags change"""
+
+    if action == 'pre_clear' and reverse:
+        # Cleared from the tag side: the affected recipes are only known beforehand
+        instance._cleared_recipe_ids = list(
+            Recipe.objects.filter(tags = instance).values_list('id', flat = True))
+        return
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        _touch_recipes(Recipe.objects.filter(pk = instance.pk))
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', None)
+        if recipe_ids:
+            _touch_recipes(Recipe.objects.filter(pk__in = recipe_ids))
+    elif pk_set:
+        _touch_recipes(Recipe.objects.filter(pk__in = pk_set))
+    bump_catalog_version(instance.user_id)
+
+
+@receiver(pre_save, sender = Recipe)
+def remember_recipe_stats(sender, instance, update_fields = None, **kwargs):
+    """Read the stored time and price the rollup currently counts"""
+
+    instance._stats_previous = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'time_minutes', 'price'} & set(update_fields):
+        return
+    instance._stats_previous = (Recipe.objects.filter(pk = instance.pk)
+                                .values_list('time_minutes', 'price').first())
+
+
+@receiver(post_save, sender = Recipe)
+def update_recipe_stats(sender, instance, created, update_fields = None, **kwargs):
+    """Move the recipe from its previous time and price buckets to the new ones"""
+
+    previous = getattr(instance, '_stats_previous', None)
+    if not created and previous is None:
+        return
+    deltas = recipe_deltas(instance.time_minutes, instance.price)
+    if previous is not None:
+        deltas += recipe_deltas(*previous, sign = -1)
+    apply_deltas(instance.user_id, deltas)
+
+
+@receiver(pre_delete, sender = Recipe)
+def remove_recipe_stats(sender, instance, **kwargs):
+    """Uncount a deleted recipe; its tag links go without m2m signals"""
+
+    tag_ids = (Recipe.tags.through.objects.filter(recipe_id = instance.pk)
+               .values_list('tag_id', flat = True))
+    apply_deltas(instance.user_id,
+                 recipe_deltas(instance.time_minutes, instance.price, sign = -1)
+                 + tag_deltas(tag_ids, sign = -1))
+
+
+@receiver(pre_delete, sender = Tag)
+def remove_tag_stats(sender, instance, **kwargs):
+    RecipeStat.objects.filter(user_id = instance.user_id, dimension = RecipeStat.TAG,
+                              key = instance.pk).delete()
+
+
+@receiver(m2m_changed, sender = Recipe.tags.through)
+def update_tag_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count links as they are added and removed, from either side"""
+
+    own, other = ('tag_id', 'recipe_id') if reverse else ('recipe_id', 'tag_id')
+
+    if action in ('pre_remove', 'pre_clear'):
+        # Only links that exist are uncounted, so collect them before they go
+        links = sender.objects.filter(**{own: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other}__in': pk_set})
+        instance._stats_unlinked = list(links.values_list(other, flat = True))
+        return
+
+    if action == 'post_add':
+        linked, sign = pk_set or (), 1
+    elif action in ('post_remove', 'post_clear'):
+        linked, sign = instance.__dict__.pop('_stats_unlinked', ()), -1
+    else:
+        return
+
+    if reverse:
+        deltas = [(RecipeStat.TAG, instance.pk, sign * len(linked))]
+    else:
+        deltas = tag_deltas(linked, sign)
+    apply_deltas(instance.user_id, deltas)
@@ -0,0 +1,166 @@
+"""
+    Incrementally maintained per-user recipe statistics
+"""
+
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from core.models import Recipe, RecipeStat, Tag
+
+
+def price_edges():
+    """Lower bounds of the price buckets in cents, starting at 0"""
+
+    return [0] + [int(Decimal(edge) * 100) for edge in settings.RECIPE_STATS_PRICE_BUCKETS]
+
+
+def price_bucket(price):
+    """Key (lower bound in cents) of the bucket holding the price"""
+
+    edges = price_edges()
+    cents = int(Decimal(str(price)) * 100)
+    return edges[max(bisect_right(edges, cents) - 1, 0)]
+
+
+def recipe_deltas(time_minutes, price, sign = 1):
+    """Rollup changes for adding (or with sign=-1 removing) one recipe"""
+
+    return [
+        (RecipeStat.TIME, time_minutes, sign),
+        (RecipeStat.PRICE, price_bucket(price), sign),
+    ]
+
+
+def tag_deltas(tag_ids, sign = 1):
+    """Rollup changes for linking (or unlinking) one recipe with the tags"""
+
+    return [(RecipeStat.TAG, tag_id, sign) for tag_id in tag_ids]
+
+
+def apply_deltas(user_id, deltas):
+    """Add the (dimension, key, delta) changes to the user's rollup rows.
+
+    Runs as one upsert, with rows in a fixed order so concurrent writers
+    cannot deadlock; rows dropping to zero are removed.
+    """
+
+    merged = {}
+    for dimension, key, delta in deltas:
+        merged[dimension, key] = merged.get((dimension, key), 0) + delta
+    rows = sorted((dimension, key, delta) for (dimension, key), delta in merged.items() if delta)
+    if not rows:
+        return
+
+    table = RecipeStat._meta.db_table
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+    params = [value for row in rows for value in (user_id, *row)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, dimension, key, count) VALUES {values} '
+            f'ON CONFLICT (user_id, dimension, key) '
+            f'DO UPDATE SET count = {table}.count + EXCLUDED.count',
+            params
+        )
+        if any(delta < 0 for _, _, delta in rows):
+            RecipeStat.objects.filter(user_id = user_id, count__lte = 0).delete()
+
+
+def rebuild(user_ids = None):
+    """Recompute the rollups from the recipes with grouped aggregates"""
+
+    recipes = Recipe.objects.all()
+    links = Recipe.tags.through.objects.all()
+    stats = RecipeStat.objects.all()
+    if user_ids is not None:
+        recipes = recipes.filter(user_id__in = user_ids)
+        links = links.filter(recipe__user_id__in = user_ids)
+        stats = stats.filter(user_id__in = user_ids)
+
+    bucket = Case(
+        *[When(price__gte = Decimal(edge) / 100, then = Value(edge)) for edge in reversed(price_edges())],
+        default = Value(0),
+        output_field = IntegerField()
+    )
+    groups = [
+        (RecipeStat.TIME, recipes.values_list('user_id', 'time_minutes')),
+        (RecipeStat.PRICE, recipes.annotate(bucket = bucket).values_list('user_id', 'bucket')),
+        (RecipeStat.TAG, links.values_list('recipe__user_id', 'tag_id')),
+    ]
+
+    with transaction.atomic():
+        stats.delete()
+        for dimension, grouped in groups:
+            RecipeStat.objects.bulk_create(
+                [RecipeStat(user_id = user_id, dimension = dimension, key = key, count = count)
+                 for user_id, key, count in grouped.order_by().annotate(count = Count('*'))],
+                batch_size = 5000
+            )
+
+
+def tag_recipe_count():
+    """Expression reading a tag's recipe count from the rollup, for Tag querysets"""
+
+    count = RecipeStat.objects.filter(
+        user_id = OuterRef('user_id'),
+        dimension = RecipeStat.TAG,
+        key = OuterRef('pk'),
+    ).values('count')
+    return Coalesce(Subquery(count), 0)
+
+
+def _median(histogram, total):
+    """Median of the values in a sorted [(value, count)] histogram"""
+
+    middle = [(total - 1) // 2, total // 2]
+    seen, found = 0, []
+    for value, count in histogram:
+        while middle and middle[0] < seen + count:
+            found.append(value)
+            middle.pop(0)
+        seen += count
+    return sum(found) / 2
+
+
+def user_stats(user_id):
+    """The dashboard statistics of one user, read from the rollup only"""
+
+    # Tag names come along in the same query, looked up for tag rows only
+    tag_name = Case(When(dimension = RecipeStat.TAG, then = Subquery(
+        Tag.objects.filter(pk = OuterRef('key'), user_id = user_id).values('name')[:1])))
+    rows = (RecipeStat.objects.filter(user_id = user_id).order_by('dimension', 'key')
+            .values_list('dimension', 'key', 'count', tag_name))
+    by_dimension = {RecipeStat.TIME: [], RecipeStat.PRICE: {}}
+    tags = []
+    for dimension, key, count, name in rows:
+        if dimension == RecipeStat.TIME:
+            by_dimension[dimension].append((key, count))
+        elif dimension == RecipeStat.PRICE:
+            by_dimension[dimension][key] = count
+        elif name is not None:
+            tags.append({'id': key, 'name': name, 'recipe_count': count})
+
+    times = by_dimension[RecipeStat.TIME]
+    total = sum(count for _, count in times)
+    edges = price_edges()
+
+    return {
+        'recipe_count': total,
+        'time_minutes': {
+            'average': round(sum(value * count for value, count in times) / total, 2) if total else None,
+            'median': _median(times, total) if total else None,
+        },
+        'price_buckets': [
+            {
+                'min': f'{Decimal(low) / 100:.2f}',
+                'max': f'{Decimal(high) / 100:.2f}' if high is not None else None,
+                'count': by_dimension[RecipeStat.PRICE].get(low, 0),
+            }
+            for low, high in zip(edges, edges[1:] + [None])
+        ],
+        'tags': sorted(tags, key = lambda tag: (tag['name'], tag['id'])),
+    }
@@ -1,4 +1,18 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework import status
 
@@ -6,10 +20,19 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from core import models
 
-from recipe.serializers import RecipeSerializers, RecipeDetailSerializer, TagSerializer
+from recipe.serializers import (
+    RecipeSerializers, RecipeDetailSerializer, RecipeRowSerializer, TagSerializer,
+)
+from recipe.pagination import RecipeCursorPagination
+from recipe.caching import bump_catalog_version
+from recipe.stats import rebuild
+from core.search import trigram_enabled
 
 RECIPE_URLS = reverse('recipe:recipe-list')
+IMPORT_URL = reverse('recipe:recipe-bulk-import')
+EXPORT_URL = reverse('recipe:recipe-export')
 TAG_URL = reverse('recipe:tag-list')
+STATS_URL = reverse('recipe:stats')
 
 # Create your tests here.
 
@@ -34,8 +57,9 @@ def create_recipe(user, **params):
 
     default.update(params)
 
-    # Creating recipe
+    # Creating recipe, indexed as the API's creators do
     recipe = models.Recipe.objects.create(**default)
+    models.Recipe.objects.filter(pk = recipe.pk).refresh_derived_fields()
     return recipe
 
 def create_recipe_url(recipe_id):
@@ -80,8 +104,452 @@ class PrivateAPITest(TestCase):
         serializer = RecipeSerializers(recipes, many = True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
-    
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_row_serializer_matches_model_serializer(self):
+        """Test list rows serialize to the same JSON as RecipeSerializers"""
+
+        recipe = create_recipe(user = self.user, title = 'Dal \u00e9', price = '12.50', link = '')
+        recipe.tags.add(
+            models.Tag.objects.create(user = self.user, name = 'Vegan'),
+            models.Tag.objects.create(user = self.user, name = 'Dinner'),
+        )
+        create_recipe(user = self.user, price = 3)
+        recipes = models.Recipe.objects.order_by('-id')
+
+        expected = RecipeSerializers(
+            recipes.prefetch_related(Prefetch('tags', models.Tag.objects.order_by('name'))),
+            many = True,
+        ).data
+        rows = list(recipes.values(*RecipeRowSerializer.values_fields()))
+        rows = RecipeRowSerializer(rows).data
+
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+        self.assertEqual(rows[1]['price'], '12.50')
+
+    @override_settings(RECIPE_FAST_LIST = False)
+    def test_recipe_list_without_row_serializer(self):
+        """Test the list still works through RecipeSerializers when disabled"""
+
+        recipe = create_recipe(user = self.user)
+        recipe.tags.add(models.Tag.objects.create(user = self.user, name = 'Vegan'))
+
+        res = self.client.get(RECIPE_URLS)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Vegan')
+
+    def test_recipe_list_cursor_pagination(self):
+        """Test recipes are paged by id cursor without overlap"""
+
+        for i in range(5):
+            create_recipe(user = self.user, title = f'Recipe {i}')
+
+        res = self.client.get(RECIPE_URLS, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNone(res.data['previous'])
+
+        seen = [r['id'] for r in res.data['results']]
+        next_url = res.data['next']
+        while next_url:
+            res = self.client.get(next_url)
+            seen.extend(r['id'] for r in res.data['results'])
+            next_url = res.data['next']
+
+        expected = list(models.Recipe.objects.filter(user = self.user)
+                        .order_by('-id').values_list('id', flat = True))
+        self.assertEqual(seen, expected)
+
+    def test_recipe_list_max_page_size(self):
+        """Test requested page size is capped at the configured maximum"""
+
+        for i in range(3):
+            create_recipe(user = self.user)
+
+        with mock.patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            res = self.client.get(RECIPE_URLS, {'page_size': 100})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_recipe_list_query_count_is_constant(self):
+        """Test listing recipes with tags does not query tags per recipe"""
+
+        tag = models.Tag.objects.create(user = self.user, name = 'Lunch')
+
+        def seed(count):
+            recipes = models.Recipe.objects.bulk_create([
+                models.Recipe(user = self.user, title = f'Recipe {i}',
+                              time_minutes = 5, price = 5.05)
+                for i in range(count)
+            ])
+            Through = models.Recipe.tags.through
+            Through.objects.bulk_create([
+                Through(recipe_id = recipe.id, tag_id = tag.id)
+                for recipe in recipes
+            ])
+            # bulk_create skips the signals keeping the tag arrays in sync
+            models.Recipe.objects.filter(pk__in = [r.id for r in recipes]).refresh_derived_fields()
+            bump_catalog_version(self.user.id)
+
+        def count_list_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(RECIPE_URLS, {'page_size': 500})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(all(r['tags'] for r in res.data['results']))
+            return len(ctx.captured_queries)
+
+        seed(10)
+        small = count_list_queries()
+        seed(990)
+        large = count_list_queries()
+
+        self.assertEqual(small, large)
+
+    def test_bulk_import_ndjson(self):
+        """Test importing recipes in chunks with per-line errors"""
+
+        models.Tag.objects.create(user = self.user, name = 'Indian')
+        lines = [
+            {'title': 'Idli', 'time_minutes': 20, 'price': '2.50',
+             'tags': [{'name': 'Indian'}, {'name': 'Breakfast'}]},
+            {'title': 'Broken', 'price': '1.00', 'tags': []},
+            {'title': 'Vada', 'time_minutes': 15, 'price': '1.50',
+             'tags': [{'name': 'Breakfast'}]},
+            {'title': 'Upma', 'time_minutes': 10, 'price': '1.00', 'tags': []},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n{not json\n'
+
+        with self.settings(RECIPE_IMPORT_CHUNK_SIZE = 2):
+            res = self.client.post(IMPORT_URL, body,
+                                   content_type = 'application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 3)
+        self.assertEqual(res.data['failed'], 2)
+        self.assertEqual([e['line'] for e in res.data['errors']], [2, 5])
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+
+        recipes = models.Recipe.objects.filter(user = self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(
+            sorted(recipes.get(title = 'Idli').tags.values_list('name', flat = True)),
+            ['Breakfast', 'Indian']
+        )
+        self.assertEqual(models.Tag.objects.filter(user = self.user).count(), 2)
+
+    def test_bulk_import_caps_reported_errors(self):
+        """Test error details are capped while failures are still counted"""
+
+        body = '\n'.join(['{}'] * 5)
+
+        with self.settings(RECIPE_IMPORT_MAX_ERRORS = 2):
+            res = self.client.post(IMPORT_URL, body,
+                                   content_type = 'application/x-ndjson')
+
+        self.assertEqual(res.data['failed'], 5)
+        self.assertEqual(len(res.data['errors']), 2)
+
+    def test_export_ndjson(self):
+        """Test recipes stream as NDJSON with their tags across chunks"""
+
+        tag = models.Tag.objects.create(user = self.user, name = 'Snack')
+        recipes = [create_recipe(user = self.user, title = f'Recipe {i}') for i in range(3)]
+        recipes[0].tags.add(tag)
+        create_recipe(user = create_user(), title = 'Not mine')
+
+        with self.settings(RECIPE_EXPORT_CHUNK_SIZE = 2):
+            res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(res.streaming_content).splitlines()]
+
+        self.assertEqual([row['id'] for row in rows], [r.id for r in reversed(recipes)])
+        self.assertEqual(rows[-1]['tags'], [{'id': tag.id, 'name': 'Snack'}])
+        self.assertEqual(rows[-1]['price'], '5.05')
+        self.assertEqual(rows[0]['tags'], [])
+
+    def test_export_csv(self):
+        """Test recipes stream as CSV with tag names joined"""
+
+        recipe = create_recipe(user = self.user, title = 'Pasta, red sauce')
+        recipe.tags.add(models.Tag.objects.create(user = self.user, name = 'Dinner'))
+        recipe.tags.add(models.Tag.objects.create(user = self.user, name = 'Italian'))
+
+        res = self.client.get(EXPORT_URL, {'export_format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = list(csv.reader(b''.join(res.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][0], 'id')
+        self.assertEqual(rows[1][1], 'Pasta, red sauce')
+        self.assertEqual(rows[1][-1], 'Dinner|Italian')
+
+    def test_export_unknown_format(self):
+        """Test an unsupported export format is rejected"""
+
+        res = self.client.get(EXPORT_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_recipes_by_any_tag(self):
+        """Test filtering returns recipes having any requested tag, once"""
+
+        vegan = models.Tag.objects.create(user = self.user, name = 'Vegan')
+        quick = models.Tag.objects.create(user = self.user, name = 'Quick')
+        both = create_recipe(user = self.user, title = 'Salad')
+        both.tags.add(vegan, quick)
+        one = create_recipe(user = self.user, title = 'Soup')
+        one.tags.add(quick)
+        create_recipe(user = self.user, title = 'Steak')
+
+        res = self.client.get(RECIPE_URLS, {'tags': f'{vegan.id},{quick.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [one.id, both.id])
+
+    def test_filter_recipes_by_all_tags(self):
+        """Test match=all only returns recipes having every requested tag"""
+
+        vegan = models.Tag.objects.create(user = self.user, name = 'Vegan')
+        quick = models.Tag.objects.create(user = self.user, name = 'Quick')
+        both = create_recipe(user = self.user, title = 'Salad')
+        both.tags.add(vegan, quick)
+        create_recipe(user = self.user, title = 'Soup').tags.add(quick)
+
+        res = self.client.get(RECIPE_URLS, {'tags': f'{vegan.id},{quick.id}', 'match': 'all'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [both.id])
+
+    def test_tag_arrays_follow_tag_changes(self):
+        """Test the denormalized tag arrays track tag adds, renames and deletes"""
+
+        payload = {'title': 'Dal', 'time_minutes': 20, 'price': '4.00',
+                   'tags': [{'name': 'Vegan'}, {'name': 'Dinner'}]}
+        res = self.client.post(RECIPE_URLS, payload, format = 'json')
+        recipe = models.Recipe.objects.get(id = res.data['id'])
+        dinner = models.Tag.objects.get(user = self.user, name = 'Dinner')
+        vegan = models.Tag.objects.get(user = self.user, name = 'Vegan')
+        self.assertEqual((recipe.tag_ids, recipe.tag_names), ([dinner.id, vegan.id], ['Dinner', 'Vegan']))
+
+        self.client.patch(create_tag_url(vegan.id), {'name': 'Plant based'})
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tag_names, ['Dinner', 'Plant based'])
+
+        self.client.delete(create_tag_url(dinner.id))
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.tag_ids, recipe.tag_names), ([vegan.id], ['Plant based']))
+
+        recipe.tags.clear()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.tag_ids, recipe.tag_names), ([], []))
+
+    def test_tag_arrays_follow_clear_from_tag_side(self):
+        """Test clearing a tag's recipes removes it from their tag arrays and filters"""
+
+        tag = models.Tag.objects.create(user = self.user, name = 'Vegan')
+        recipe = create_recipe(user = self.user, title = 'Dal')
+        recipe.tags.add(tag)
+
+        tag.recipe_set.clear()
+
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.tag_ids, recipe.tag_names), ([], []))
+        res = self.client.get(RECIPE_URLS, {'tags': f'{tag.id}'})
+        self.assertEqual(res.data['results'], [])
+
+    @override_settings(RECIPE_TAG_ARRAYS = False)
+    def test_filter_recipes_through_join(self):
+        """Test tag filters and list tags also work without the tag arrays"""
+
+        tag1 = models.Tag.objects.create(user = self.user, name = 'Vegan')
+        tag2 = models.Tag.objects.create(user = self.user, name = 'Dinner')
+        both = create_recipe(user = self.user, title = 'Both')
+        both.tags.add(tag1, tag2)
+        one = create_recipe(user = self.user, title = 'One')
+        one.tags.add(tag1)
+
+        res = self.client.get(RECIPE_URLS, {'tags': f'{tag1.id},{tag2.id}'})
+        self.assertEqual([r['id'] for r in res.data['results']], [one.id, both.id])
+        self.assertEqual([t['name'] for t in res.data['results'][1]['tags']], ['Dinner', 'Vegan'])
+
+        res = self.client.get(RECIPE_URLS, {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'})
+        self.assertEqual([r['id'] for r in res.data['results']], [both.id])
+
+    def test_filter_recipes_invalid_params(self):
+        """Test malformed tag filters are rejected"""
+
+        res = self.client.get(RECIPE_URLS, {'tags': '1,abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(RECIPE_URLS, {'tags': '1', 'match': 'some'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_list_is_cached_until_write(self):
+        """Test repeated lists are served from cache and writes invalidate it"""
+
+        create_recipe(user = self.user)
+        self.client.get(RECIPE_URLS)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URLS)
+        self.assertEqual(len(res.data['results']), 1)
+
+        payload = {'title': 'Poha', 'time_minutes': 10, 'price': 2, 'tags': [{'name': 'Quick'}]}
+        self.client.post(RECIPE_URLS, payload, format = 'json')
+        res = self.client.get(RECIPE_URLS)
+        self.assertEqual(len(res.data['results']), 2)
+
+        tag = models.Tag.objects.get(user = self.user, name = 'Quick')
+        self.client.patch(create_tag_url(tag.id), {'name': 'Fast'})
+        res = self.client.get(RECIPE_URLS)
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Fast')
+
+    def test_recipe_list_etag_not_modified(self):
+        """Test a matching If-None-Match gets 304 until the catalog changes"""
+
+        create_recipe(user = self.user)
+        res = self.client.get(RECIPE_URLS)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URLS, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_recipe(user = self.user)
+        res = self.client.get(RECIPE_URLS, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_recipe_list_cache_is_per_user(self):
+        """Test cached lists are never shared between users"""
+
+        create_recipe(user = self.user)
+        self.client.get(RECIPE_URLS)
+
+        other = create_user()
+        self.client.force_authenticate(other)
+        res = self.client.get(RECIPE_URLS)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_recipe_detail_conditional_get(self):
+        """Test detail requests are validated from updated_at alone"""
+
+        recipe = create_recipe(user = self.user)
+        url = create_recipe_url(recipe.id)
+        res = self.client.get(url)
+        etag, last_modified = res['ETag'], res['Last-Modified']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE = last_modified)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        recipe.title = 'Changed title'
+        recipe.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Changed title')
+
+    def test_recipe_list_updated_since(self):
+        """Test incremental sync returns only recipes changed after a time"""
+
+        old = create_recipe(user = self.user, title = 'Old')
+        changed = create_recipe(user = self.user, title = 'Changed')
+        since = timezone.now()
+        models.Recipe.objects.filter(id = old.id).update(
+            updated_at = since - timedelta(days = 1))
+        changed.tags.add(models.Tag.objects.create(user = self.user, name = 'New'))
+
+        res = self.client.get(RECIPE_URLS, {'updated_since': since.isoformat()})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [changed.id])
+
+        res = self.client.get(RECIPE_URLS, {'updated_since': 'yesterday'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tag_rename_touches_recipes(self):
+        """Test renaming a tag marks its recipes as updated"""
+
+        tag = models.Tag.objects.create(user = self.user, name = 'Spicy')
+        recipe = create_recipe(user = self.user)
+        recipe.tags.add(tag)
+        recipe.refresh_from_db()
+        before = recipe.updated_at
+
+        self.client.patch(create_tag_url(tag.id), {'name': 'Hot'})
+
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, before)
+
+    def test_search_recipes_ranked(self):
+        """Test ?q= matches title, description and tags, title hits first"""
+
+        in_title = create_recipe(user = self.user, title = 'Mango lassi',
+                                 description = 'Cold drink')
+        in_description = create_recipe(user = self.user, title = 'Smoothie',
+                                       description = 'Blended with ripe mangoes')
+        tagged = create_recipe(user = self.user, title = 'Aam panna', description = '')
+        tagged.tags.add(models.Tag.objects.create(user = self.user, name = 'Mango'))
+        create_recipe(user = self.user, title = 'Dal', description = 'Lentils')
+
+        res = self.client.get(RECIPE_URLS, {'q': 'mango'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids[0], in_title.id)
+        self.assertEqual(set(ids), {in_title.id, in_description.id, tagged.id})
+
+    def test_search_follows_tag_rename(self):
+        """Test the search index picks up renamed tags"""
+
+        tag = models.Tag.objects.create(user = self.user, name = 'Starter')
+        create_recipe(user = self.user, title = 'Soup').tags.add(tag)
+
+        self.client.patch(create_tag_url(tag.id), {'name': 'Appetizer'})
+
+        self.assertEqual(self.client.get(RECIPE_URLS, {'q': 'appetizer'}).data['count'], 1)
+        self.assertEqual(self.client.get(RECIPE_URLS, {'q': 'starter'}).data['count'], 0)
+
+    def test_recipe_saves_reindex_only_text_changes(self):
+        """Test creates are indexed once and saves skip the index unless the text changed"""
+
+        def search_updates(run):
+            with CaptureQueriesContext(connection) as context:
+                run()
+            return [q['sql'] for q in context.captured_queries
+                    if q['sql'].startswith('UPDATE "core_recipe"') and '"search_vector"' in q['sql']]
+
+        payload = {'title': 'Soup', 'time_minutes': 10, 'price': '2.00', 'tags': [{'name': 'Starter'}]}
+        self.assertEqual(len(search_updates(lambda: self.client.post(RECIPE_URLS, payload, format = 'json'))), 1)
+
+        recipe = models.Recipe.objects.get(title = 'Soup')
+        recipe.price = 3
+        self.assertEqual(search_updates(lambda: recipe.save(update_fields = ['price'])), [])
+
+        recipe.title = 'Broth'
+        self.assertEqual(len(search_updates(lambda: recipe.save(update_fields = ['title']))), 1)
+        self.assertEqual(self.client.get(RECIPE_URLS, {'q': 'broth'}).data['count'], 1)
+
+    def test_search_tolerates_typos(self):
+        """Test misspelt words still find recipes by title"""
+
+        if not trigram_enabled():
+            self.skipTest('Trigram search is disabled or pg_trgm is not installed')
+
+        recipe = create_recipe(user = self.user, title = 'Butter chicken')
+
+        res = self.client.get(RECIPE_URLS, {'q': 'chiken'})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
     def test_recipe_details(self):
         """Test for recipe details of single recipe"""
 
@@ -132,6 +600,31 @@ class PrivateTagsApiTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_list_tags_with_recipe_count(self):
+        """Test tag usage counts, assigned_only and count ordering in one query"""
+
+        dessert = models.Tag.objects.create(user = self.user, name = 'Dessert')
+        vegan = models.Tag.objects.create(user = self.user, name = 'Vegan')
+        models.Tag.objects.create(user = self.user, name = 'Unused')
+        for i in range(3):
+            create_recipe(user = self.user, title = f'R{i}').tags.add(vegan, *([dessert] if i else []))
+        other = create_user('other@email.com')
+        create_recipe(user = other).tags.add(models.Tag.objects.create(user = other, name = 'Vegan'))
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAG_URL, {'with_recipe_count': 1, 'ordering': '-recipe_count'})
+        self.assertEqual([(t['name'], t['recipe_count']) for t in res.data],
+                         [('Vegan', 3), ('Dessert', 2), ('Unused', 0)])
+
+        res = self.client.get(TAG_URL, {'assigned_only': 1, 'ordering': 'recipe_count'})
+        self.assertEqual(res.data, [{'id': dessert.id, 'name': 'Dessert'},
+                                    {'id': vegan.id, 'name': 'Vegan'}])
+
+        res = self.client.get(TAG_URL, {'ordering': 'recipe_count', 'assigned_only': 'yes'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(TAG_URL, {'ordering': 'id'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_update_tag(self):
         """Test to patch tag details"""
 
@@ -197,4 +690,210 @@ class PrivateTagsApiTest(TestCase):
         created_recipe = created_recipes[0]
         self.assertEqual(created_recipe.tags.count(), 2)
 
-        self.assertIn(indian_tag, created_recipe.tags.all())
\ No newline at end of file
+        self.assertIn(indian_tag, created_recipe.tags.all())
+
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test repeated tag names in a payload map to a single tag"""
+
+        payload = {
+            'title' : 'Dosa',
+            'time_minutes' : 20,
+            'price' : 3,
+            'tags' : [{'name' : 'Breakfast'}, {'name' : 'Breakfast'}]
+        }
+
+        res = self.client.post(RECIPE_URLS, payload, format = 'json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = models.Recipe.objects.get(id = res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(models.Tag.objects.filter(user = self.user).count(), 1)
+
+    def test_create_recipe_tag_query_count_is_constant(self):
+        """Test recipe creation does not query per tag"""
+
+        def count_create_queries(tag_count, prefix):
+            payload = {
+                'title' : 'Biryani',
+                'time_minutes' : 60,
+                'price' : 12,
+                'tags' : [{'name' : f'{prefix}{i}'} for i in range(tag_count)]
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(RECIPE_URLS, payload, format = 'json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(res.data['tags']), tag_count)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_create_queries(2, 'a'), count_create_queries(20, 'b'))
+
+    def test_update_tag_to_existing_name(self):
+        """Test renaming a tag onto another tag's name is rejected"""
+
+        models.Tag.objects.create(user = self.user, name = 'Dessert')
+        tag = models.Tag.objects.create(user = self.user, name = 'Sweets')
+
+        res = self.client.patch(create_tag_url(tag.id), {'name': 'Dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Sweets')
+
+    def test_concurrent_tag_rename_clash(self):
+        """Test a rename that passed validation before a clashing one committed is a 400"""
+
+        models.Tag.objects.create(user = self.user, name = 'Dessert')
+        tag = models.Tag.objects.create(user = self.user, name = 'Sweets')
+        expected = self.client.patch(create_tag_url(tag.id), {'name': 'Dessert'}).data
+
+        # As if the other rename committed between validation and save
+        with mock.patch.object(TagSerializer, 'validate_name', lambda self, value: value):
+            res = self.client.patch(create_tag_url(tag.id), {'name': 'Dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data, expected)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Sweets')
+
+
+class AsgiApiTest(TestCase):
+    """Test the API served through Django's ASGI handler"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = Token.objects.create(user = self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = f'Token {self.token.key}')
+        self.async_client = AsyncClient()
+        tag = models.Tag.objects.create(user = self.user, name = 'Vegan')
+        self.recipe = create_recipe(user = self.user, title = 'Dal')
+        self.recipe.tags.add(tag)
+        create_recipe(user = self.user, title = 'Tofu curry')
+
+    def get(self, path, **extra):
+        async def request():
+            return await self.async_client.get(path, **extra)
+
+        extra.setdefault('AUTHORIZATION', f'Token {self.token.key}')
+        return async_to_sync(request)()
+
+    def test_asgi_responses_match_wsgi(self):
+        """Test list, detail and tag reads return the WSGI bodies and headers"""
+
+        for url in (RECIPE_URLS, create_recipe_url(self.recipe.id), TAG_URL):
+            res = self.get(url)
+            sync = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(res.content), sync.json())
+            for header in ('Content-Type', 'Vary', 'Allow'):
+                self.assertEqual(res[header], sync[header])
+
+    def test_asgi_cached_list_skips_database(self):
+        """Test a repeated list is served from the caches without queries"""
+
+        self.get(RECIPE_URLS)
+        with self.assertNumQueries(0):
+            res = self.get(RECIPE_URLS)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_asgi_requires_authentication(self):
+        """Test missing tokens are rejected under ASGI"""
+
+        res = self.get(RECIPE_URLS, AUTHORIZATION = '')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RecipeStatsApiTest(TestCase):
+    """Test the statistics endpoint and its rollup maintenance"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def rollup(self):
+        return sorted(models.RecipeStat.objects.filter(user = self.user)
+                      .values_list('dimension', 'key', 'count'))
+
+    def assertRollupIsFresh(self):
+        """The incrementally kept rollup equals a rebuild from scratch"""
+
+        incremental = self.rollup()
+        rebuild([self.user.id])
+        self.assertEqual(incremental, self.rollup())
+
+    def test_stats_follow_recipe_and_tag_writes(self):
+        """Test creates, updates, retags and deletes keep the rollup exact"""
+
+        for title, minutes, price, tags in [('Dal', 20, '4.50', ['Vegan', 'Dinner']),
+                                            ('Tikka', 40, '12.00', ['Dinner']),
+                                            ('Cake', 40, '120.00', [])]:
+            payload = {'title': title, 'time_minutes': minutes, 'price': price,
+                       'tags': [{'name': name} for name in tags]}
+            self.client.post(RECIPE_URLS, payload, format = 'json')
+        self.assertRollupIsFresh()
+
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertEqual(res.data['time_minutes'], {'average': 33.33, 'median': 40.0})
+        self.assertEqual([b['count'] for b in res.data['price_buckets']], [1, 0, 1, 0, 0, 1])
+        self.assertEqual(res.data['price_buckets'][-1], {'min': '100.00', 'max': None, 'count': 1})
+        self.assertEqual([(t['name'], t['recipe_count']) for t in res.data['tags']],
+                         [('Dinner', 2), ('Vegan', 1)])
+
+        dal = models.Recipe.objects.get(title = 'Dal')
+        vegan = models.Tag.objects.get(name = 'Vegan')
+        dinner = models.Tag.objects.get(name = 'Dinner')
+        self.client.patch(create_recipe_url(dal.id), {'time_minutes': 10, 'price': '60.00'})
+        self.assertRollupIsFresh()
+
+        dal.tags.remove(vegan)
+        dal.tags.remove(vegan)
+        vegan.recipe_set.add(*models.Recipe.objects.all())
+        self.assertRollupIsFresh()
+        dinner.recipe_set.clear()
+        self.assertRollupIsFresh()
+
+        self.client.delete(create_tag_url(vegan.id))
+        self.client.delete(create_recipe_url(dal.id))
+        self.assertRollupIsFresh()
+
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['tags'], [])
+
+    def test_stats_for_imported_recipes(self):
+        """Test bulk imported recipes are counted"""
+
+        lines = [json.dumps({'title': f'R{i}', 'time_minutes': i, 'price': '7.00',
+                             'tags': [{'name': 'Batch'}]}) for i in range(1, 4)]
+        self.client.post(IMPORT_URL, '\n'.join(lines), content_type = 'application/x-ndjson')
+        self.assertRollupIsFresh()
+
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['time_minutes'], {'average': 2.0, 'median': 2.0})
+        self.assertEqual(res.data['tags'][0]['recipe_count'], 3)
+
+    def test_stats_empty_and_query_count(self):
+        """Test an empty catalog and a constant number of queries"""
+
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertEqual(res.data['time_minutes'], {'average': None, 'median': None})
+
+        tags = [models.Tag.objects.create(user = self.user, name = f'Tag {i}') for i in range(3)]
+        for i in range(30):
+            create_recipe(user = self.user, time_minutes = i, price = i).tags.add(tags[i % 3])
+        with self.assertNumQueries(1):
+            res = self.client.get(STATS_URL)
+        self.assertEqual([(t['name'], t['recipe_count']) for t in res.data['tags']],
+                         [('Tag 0', 10), ('Tag 1', 10), ('Tag 2', 10)])
+
+    def test_stats_requires_authentication(self):
+        """Test the endpoint is private"""
+
+        res = APIClient().get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -10,5 +10,7 @@ router.register('tag', views.TagViewset)
 app_name = 'recipe'
 
 urlpatterns = [
+    path('stats/', views.RecipeStatsView.as_view(), name = 'stats'),
     path('', include(router.urls))
-]
\ No newline at end of file
+]
+
@@ -1,48 +1,240 @@
 
-from rest_framework import viewsets, authentication, permissions, mixins
-from recipe.serializers import RecipeSerializers, RecipeDetailSerializer, TagSerializer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework import viewsets, permissions, mixins, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from recipe.serializers import (
+    RecipeSerializers, RecipeDetailSerializer, RecipeRowSerializer, TagSerializer,
+    TagUsageSerializer,
+)
+from recipe.pagination import RecipeCursorPagination, RecipeSearchPagination
+from recipe.importers import RecipeImporter
+from recipe.exporters import RecipeExporter
+from recipe.caching import CatalogCacheMixin
+from recipe.stats import tag_recipe_count, user_stats
+from core.authentication import CachedTokenAuthentication
 from core.models import Recipe, Tag
 
-class RecipeViewset(viewsets.ModelViewSet):
+class RecipeViewset(CatalogCacheMixin, viewsets.ModelViewSet):
 
     serializer_class = RecipeSerializers
-    queryset = Recipe.objects.all().order_by('-id')
-    authentication_classes = [authentication.TokenAuthentication]
+    queryset = Recipe.objects.defer('search_vector').order_by('-id')
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    # Throttled in their own scope, each request moves many recipes
+    bulk_actions = ('bulk_import', 'export')
+
+    def _params_to_ints(self, qs):
+        """Convert a comma separated list of ids to integers"""
+
+        try:
+            return [int(str_id) for str_id in qs.split(',')]
+        except ValueError:
+            raise ValidationError({'tags': ['Must be a comma separated list of ids.']})
+
+    def _param_to_datetime(self, value):
+        """Parse an ISO 8601 timestamp query parameter"""
+
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({'updated_since': ['Must be an ISO 8601 datetime.']})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, timezone.utc)
+        return parsed
 
     def get_queryset(self):
         tags = self.request.query_params.get('tags')
+        match = self.request.query_params.get('match', 'any')
         queryset = self.queryset
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': ['Must be one of: any, all.']})
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.with_tags(tag_ids, match_all = match == 'all')
+
+        updated_since = self.request.query_params.get('updated_since')
+        if updated_since:
+            queryset = queryset.filter(updated_at__gt = self._param_to_datetime(updated_since))
 
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        )
+
+        search = self.request.query_params.get('q')
+        if search:
+            queryset = queryset.search(search)
+        else:
+            queryset = queryset.order_by('-id')
+
+        if self.use_row_serializer:
+            queryset = queryset.values(*RecipeRowSerializer.values_fields())
+        elif self.action not in ('retrieve', 'export'):
+            # Loading tags for the whole page in one query instead of one per recipe
+            queryset = queryset.prefetch_related(Prefetch('tags', Tag.objects.order_by('name')))
+        return queryset
+
+    @property
+    def use_row_serializer(self):
+        """List pages skip model instances and ModelSerializer field dispatch"""
+
+        return settings.RECIPE_FAST_LIST and self.action == 'list'
     
+    @property
+    def paginator(self):
+        """Ranked search results are paged by number instead of id cursor"""
+
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('q'):
+                self._paginator = RecipeSearchPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return RecipeDetailSerializer
         return self.serializer_class
+
+    def get_serializer(self, *args, **kwargs):
+        if self.use_row_serializer and kwargs.get('many'):
+            return RecipeRowSerializer(*args)
+        return super().get_serializer(*args, **kwargs)
     
+    def retrieve(self, request, *args, **kwargs):
+        """Answer conditional requests from updated_at before serializing"""
+
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        updated_at = get_object_or_404(
+            self.get_queryset().values_list('updated_at', flat = True), **lookup)
+
+        etag = quote_etag(f'{lookup[self.lookup_field]}:{updated_at.isoformat()}')
+        last_modified = int(updated_at.timestamp())
+        response = get_conditional_response(request, etag = etag, last_modified = last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
     def perform_create(self, serializer):
         """Creating recipe"""
 
         serializer.save(user = self.request.user)
 
-class TagViewset(mixins.ListModelMixin, 
+    @action(detail = False, methods = ['post'], url_path = 'import')
+    def bulk_import(self, request):
+        """Import recipes from an NDJSON body, one recipe per line"""
+
+        importer = RecipeImporter(
+            user = request.user,
+            context = self.get_serializer_context(),
+            chunk_size = settings.RECIPE_IMPORT_CHUNK_SIZE,
+            max_errors = settings.RECIPE_IMPORT_MAX_ERRORS
+        )
+        # Reading the raw request stream line by line instead of request.data
+        summary = importer.run(request._request)
+        return Response(summary, status = status.HTTP_200_OK)
+
+    @action(detail = False, methods = ['get'])
+    def export(self, request):
+        """Stream the user's recipes as NDJSON or CSV"""
+
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in RecipeExporter.content_types:
+            return Response(
+                {'export_format': [f'Must be one of: {", ".join(RecipeExporter.content_types)}.']},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        exporter = RecipeExporter(
+            self.get_queryset(),
+            chunk_size = settings.RECIPE_EXPORT_CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(
+            exporter.stream(export_format),
+            content_type = RecipeExporter.content_types[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="recipes.{export_format}"'
+        return response
+
+class TagViewset(CatalogCacheMixin,
+                 mixins.ListModelMixin,
                  mixins.UpdateModelMixin,
                  mixins.DestroyModelMixin,
                  viewsets.GenericViewSet):
 
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    orderings = ['name', '-name', 'recipe_count', '-recipe_count']
+
+    def _flag(self, name):
+        value = self.request.query_params.get(name, '0')
+        if value not in ('0', '1'):
+            raise ValidationError({name: ['Must be 0 or 1.']})
+        return value == '1'
 
     def get_queryset(self):
-        return self.queryset.filter(user = self.request.user).order_by('-name')
+        queryset = self.queryset.filter(user = self.request.user)
+        if self.action != 'list':
+            return queryset.order_by('-name')
+
+        ordering = self.request.query_params.get('ordering', '-name')
+        if ordering not in self.orderings:
+            raise ValidationError({'ordering': [f'Must be one of: {", ".join(self.orderings)}.']})
+        assigned_only = self._flag('assigned_only')
+
+        if assigned_only or self._flag('with_recipe_count') or ordering.endswith('recipe_count'):
+            # Read from the statistics rollup in the same query
+            queryset = queryset.annotate(recipe_count = tag_recipe_count())
+        if assigned_only:
+            queryset = queryset.filter(recipe_count__gt = 0)
+        if ordering.endswith('recipe_count'):
+            return queryset.order_by(ordering, 'name')
+        return queryset.order_by(ordering)
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self._flag('with_recipe_count'):
+            return TagUsageSerializer
+        return self.serializer_class
+
+    def perform_update(self, serializer):
+        # validate_name() cannot see a concurrent rename, the unique constraint can
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({'name': [serializer.error_messages['name_taken']]})
 
     def patch(self):
-        super().partial_update(self.request)
\ No newline at end of file
+        super().partial_update(self.request)
+
+
+class RecipeStatsView(APIView):
+    """Recipe counts, time and price distribution and tag usage of the user.
+
+    Read from the maintained rollup, so the cost does not grow with the
+    number of recipes.
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(user_stats(request.user.id))
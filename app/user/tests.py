@@ -1,3 +1,121 @@
-from django.test import TestCase
+"""
+    Tests for the user API login
+"""
 
-# Create your tests here.
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+try:
+    import argon2
+except ImportError:  # pragma: no cover
+    argon2 = None
+
+TOKEN_URL = reverse('user:token')
+
+
+class LoginTests(TestCase):
+
+    def setUp(self):
+        caches[settings.LOGIN_RATE_LIMIT_CACHE].clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('login@example.com', 'pass12345')
+
+    def _login(self, email = 'login@example.com', password = 'pass12345', **extra):
+        return self.client.post(TOKEN_URL, {'email': email, 'password': password}, **extra)
+
+    def test_login_returns_token(self):
+        """Test a login creates the user's token and returns it"""
+
+        res = self._login()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['token'], Token.objects.get(user = self.user).key)
+
+    def test_repeated_login_reuses_token(self):
+        """Test later logins read the existing token without writing it"""
+
+        token = self._login().data['token']
+
+        with self.assertNumQueries(2):
+            res = self._login()
+        self.assertEqual(res.data['token'], token)
+        self.assertEqual(Token.objects.count(), 1)
+
+    def test_deleted_token_is_reissued(self):
+        """Test a login after the token was deleted creates a fresh one"""
+
+        old = self._login().data['token']
+        Token.objects.filter(key = old).delete()
+
+        new = self._login().data['token']
+
+        self.assertNotEqual(old, new)
+        self.assertEqual(Token.objects.get(user = self.user).key, new)
+
+    @override_settings(LOGIN_RATE_LIMIT_PER_EMAIL = 3)
+    def test_failed_logins_limited_per_email(self):
+        """Test an email with too many failures is refused before hashing"""
+
+        for _ in range(3):
+            self.assertEqual(self._login(password = 'wrong').status_code, status.HTTP_400_BAD_REQUEST)
+
+        with patch('user.serializers.authenticate') as patched_authenticate:
+            res = self._login()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        patched_authenticate.assert_not_called()
+        self.assertEqual(self._login(email = 'LOGIN@example.com').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(LOGIN_RATE_LIMIT_PER_EMAIL = 3)
+    def test_successful_login_clears_email_failures(self):
+        """Test failures before a successful login are forgotten"""
+
+        for _ in range(2):
+            self._login(password = 'wrong')
+        self.assertEqual(self._login().status_code, status.HTTP_200_OK)
+
+        for _ in range(2):
+            self._login(password = 'wrong')
+        self.assertEqual(self._login().status_code, status.HTTP_200_OK)
+
+    @override_settings(LOGIN_RATE_LIMIT_PER_IP = 2, LOGIN_RATE_LIMIT_PER_EMAIL = 0)
+    def test_failed_logins_limited_per_ip(self):
+        """Test one address trying many emails is refused, others are not"""
+
+        self._login(email = 'a@example.com', REMOTE_ADDR = '10.0.0.1')
+        self._login(email = 'b@example.com', REMOTE_ADDR = '10.0.0.1')
+
+        self.assertEqual(self._login(REMOTE_ADDR = '10.0.0.1').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self._login(REMOTE_ADDR = '10.0.0.2').status_code, status.HTTP_200_OK)
+
+    def test_login_rejects_non_object_body(self):
+        """Test a JSON body that is not an object is a validation error"""
+
+        res = self.client.post(TOKEN_URL, [1, 2], format = 'json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(argon2, 'argon2-cffi is not installed')
+    def test_login_upgrades_password_hash(self):
+        """Test a login rehashes the password with the preferred hasher"""
+
+        hashers = ['django.contrib.auth.hashers.Argon2PasswordHasher', *settings.PASSWORD_HASHERS]
+        with override_settings(PASSWORD_HASHERS = hashers):
+            res = self._login()
+            self.user.refresh_from_db()
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(self.user.password.startswith('argon2'))
+            self.assertTrue(self.user.check_password('pass12345'))
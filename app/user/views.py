@@ -1,21 +1,50 @@
 # Create your views here.
 
-from rest_framework import generics, authentication, permissions
+from collections.abc import Mapping
+
+from rest_framework import generics, permissions
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from user.serializers import UserSerializer, AuthTokenSerializer
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from core.authentication import CachedTokenAuthentication, issue_token
+from core.ratelimit import LoginRateLimiter
 
 class CreateUserView(generics.CreateAPIView):
     """Class based view for creating users"""
 
     serializer_class = UserSerializer
+    throttle_scope = 'auth'
 
 
 class CreateTokenView(ObtainAuthToken):
     
     serializer_class =  AuthTokenSerializer
     renderer_class = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'auth'
+
+    def post(self, request, *args, **kwargs):
+        """Issue the user's token, refusing emails and IPs with too many failures"""
+
+        # Bodies that are not objects get their 400 from the serializer
+        email = request.data.get('email') if isinstance(request.data, Mapping) else None
+        limiter = LoginRateLimiter(request, email)
+        wait = limiter.wait()
+        if wait is not None:
+            raise Throttled(wait = wait)
+
+        serializer = self.get_serializer(data = request.data)
+        try:
+            serializer.is_valid(raise_exception = True)
+        except ValidationError:
+            limiter.failed()
+            raise
+        limiter.succeeded()
+        return Response({'token': issue_token(serializer.validated_data['user'])})
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """
@@ -23,7 +52,7 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     """
 
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):